@@ -0,0 +1,4 @@
+"""
+Benchmarks for RDB extraction on a generated corpus of synthetic RDB files.
+See bench.py for usage.
+"""
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+"""
+bench.py
+Reproducible extraction benchmarks over a synthetic RDB corpus.
+
+Run from the top of the repository:
+
+    python -m benchmarks.bench                    # 10 and 1000 files
+    python -m benchmarks.bench --sizes 10 1000 10000
+    python -m benchmarks.bench --update-baseline
+
+Timings are per file, the best of several repeats, and are compared with
+benchmarks/baseline.json. Anything slower than the baseline by more than the
+tolerance is reported and the exit status is 1. Baselines are only meaningful
+on the machine they were recorded on, so update them when changing machine.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+from contextlib import redirect_stdout
+from io import StringIO
+
+import rdbextract
+
+from benchmarks.corpus import make_corpus
+
+BENCH_PATH = os.path.dirname(os.path.realpath(__file__))
+BASELINE_FILE = os.path.join(BENCH_PATH, 'baseline.json')
+CORPUS_PATH = os.path.join(BENCH_PATH, 'corpus')
+
+DEFAULT_SIZES = [10, 1000]
+DEFAULT_TOLERANCE = 0.25
+SETTINGS = ['RID', 'TID', 'FID', 'G1:50P1P', 'G1:51P1TD', 'P1:MAXACC', 'NOTHERE']
+
+def make_args(settings=SETTINGS, jobs=1):
+    """ the equivalent of the parsed rdbextract command line """
+    return argparse.Namespace(settings=list(settings), o=None, console=False,
+                              jobs=jobs, index=None, dedup=False,
+                              include=None, exclude=None, max_depth=None)
+
+def best_of(func, repeats):
+    """ lowest wall clock time of repeats calls to func """
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best == None else min(best, elapsed)
+    return best
+
+def quietly(func):
+    """ run func discarding anything it prints """
+    with redirect_stdout(StringIO()):
+        return func()
+
+def bench_get_ole_data(files, repeats):
+    def run():
+        for f in files:
+            rdbextract.get_ole_data(f)
+    return best_of(run, repeats) / len(files)
+
+def bench_extract_parameters(files, repeats):
+    args = make_args()
+    rdb_infos = [[f, rdbextract.get_ole_data(f)] for f in files]
+    def run():
+        for f, rdb_info in rdb_infos:
+            rdbextract.extract_parameters(f, rdb_info, args)
+    return best_of(run, repeats) / len(files)
+
+def bench_process_rdb_files(files, repeats):
+    args = make_args()
+    return best_of(lambda: quietly(lambda: rdbextract.process_rdb_files(files, args)),
+                   repeats) / len(files)
+
+def run_benchmarks(sizes, corpus_path=CORPUS_PATH):
+    """ returns a dict of benchmark name to seconds per file """
+    results = {}
+    largest = make_corpus(corpus_path, max(sizes))
+
+    for size in sizes:
+        files = largest[0:size]
+        # fewer repeats on the big corpora, they are less noisy anyway
+        repeats = 5 if size <= 100 else 1
+        if size <= 1000:
+            results['get_ole_data[{}]'.format(size)] = bench_get_ole_data(files, repeats)
+            results['extract_parameters[{}]'.format(size)] = bench_extract_parameters(files, repeats)
+        results['process_rdb_files[{}]'.format(size)] = bench_process_rdb_files(files, repeats)
+
+    return results
+
+def load_baseline(filename=BASELINE_FILE):
+    if os.path.exists(filename):
+        with open(filename) as f:
+            return json.load(f)
+    return {'results': {}}
+
+def save_baseline(results, filename=BASELINE_FILE):
+    baseline = load_baseline(filename)
+    baseline['machine'] = platform.platform()
+    baseline['python'] = platform.python_version()
+    baseline['results'].update(results)
+    with open(filename, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """ prints a table against the baseline, returns the names which got slower """
+    regressions = []
+    print('{:<32} {:>12} {:>12} {:>8}'.format('Benchmark', 'ms/file', 'baseline', 'change'))
+    for name, seconds in results.items():
+        base = baseline['results'].get(name)
+        if base:
+            change = seconds / base - 1
+            flag = ''
+            if change > tolerance:
+                regressions.append(name)
+                flag = ' SLOWER'
+            print('{:<32} {:>12.3f} {:>12.3f} {:>+8.0%}{}'.format(name, seconds * 1e3,
+                                                                   base * 1e3, change, flag))
+        else:
+            print('{:<32} {:>12.3f} {:>12} {:>8}'.format(name, seconds * 1e3, '-', '-'))
+    return regressions
+
+def main(arg=None):
+    parser = argparse.ArgumentParser(description='Benchmark RDB extraction on a synthetic corpus.')
+    parser.add_argument('--sizes', metavar='N', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='Corpus sizes to run, in files. Default: 10 1000')
+    parser.add_argument('--corpus', metavar='PATH', default=CORPUS_PATH,
+                        help='Where to keep the generated corpus.')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Allowed slowdown against the baseline, e.g. 0.25 for 25%%')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='Store these results as the new baseline.')
+
+    args = parser.parse_args(arg.split() if arg else None)
+
+    results = run_benchmarks(args.sizes, args.corpus)
+    regressions = compare(results, load_baseline(), args.tolerance)
+
+    if args.update_baseline:
+        save_baseline(results)
+        print('Baseline updated: ' + BASELINE_FILE)
+    elif regressions:
+        print('Slower than baseline: ' + ', '.join(regressions))
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
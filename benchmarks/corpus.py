@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+"""
+corpus.py
+Generates synthetic RDB files for benchmarking.
+
+Each file holds several relays (settings names) under Relays, each with the
+streams of a typical SEL-400 series relay: global settings with the FID, a
+protection group, protection logic, automation logic and a port. Settings use
+the \\x1c\\r\\n line endings found in Quickset RDBs and the counts are roughly
+those of the Transpower standard designs. Generation is seeded so the same
+corpus is produced every time.
+"""
+
+import os
+import random
+
+from benchmarks.olewriter import write_ole
+
+EOL = '\x1c\r\n'
+
+RELAYS_PER_FILE = 4
+GROUP_SETTINGS = 400
+GLOBAL_SETTINGS = 120
+PORT_SETTINGS = 40
+PROTECTION_LOGIC_LINES = 200
+AUTOMATION_LOGIC_LINES = 400
+
+ELEMENTS = ['IN101', 'IN102', 'IN106', 'IN201', 'IN203', '52CLS', '52CLU',
+            'TRIP', 'LOPV', 'OCS', 'PB12', 'AFRTEXP', 'REF50T1', 'C67UP1T']
+
+def setting(name, value):
+    return '{},"{}"{}'.format(name, value, EOL)
+
+def random_value(rng):
+    choice = rng.random()
+    if choice < 0.4:
+        return '{:f}'.format(rng.uniform(0, 100))
+    elif choice < 0.7:
+        return rng.choice(['Y', 'N', 'OFF', '1', '2', '5'])
+    else:
+        return rng.choice(ELEMENTS) + ' OR ' + rng.choice(ELEMENTS)
+
+def random_equation(rng, prefix):
+    if prefix == 'A':
+        target = 'ASV{:03}'.format(rng.randint(1, 256))
+        terms = ['ASV{:03}'.format(rng.randint(1, 256)), 'ALT{:02}'.format(rng.randint(1, 32)),
+                 'AST{:02}Q'.format(rng.randint(1, 32))]
+    else:
+        target = 'PSV{:02}'.format(rng.randint(1, 64))
+        terms = ['PSV{:02}'.format(rng.randint(1, 64)), 'PLT{:02}'.format(rng.randint(1, 32)),
+                 'PCT{:02}Q'.format(rng.randint(1, 32))]
+    terms += rng.sample(ELEMENTS, 3)
+    rng.shuffle(terms)
+    eqn = ' AND '.join(terms[0:2]) + ' OR (' + ' AND NOT '.join(terms[2:4]) + ')'
+    if rng.random() < 0.2:
+        eqn = 'R_TRIG ' + terms[4] + ' AND ' + eqn
+    comment = ' # GENERATED LINE' if rng.random() < 0.3 else ''
+    return target + ' := ' + eqn + comment
+
+def logic_stream(rng, prefix, lines):
+    text = ''
+    for k in range(1, lines + 1):
+        if rng.random() < 0.1:
+            line = '# COMMENT LINE {}'.format(k)
+        else:
+            line = random_equation(rng, prefix)
+        text += setting(str(k), line)
+    return text
+
+def relay_streams(rng, relay, number):
+    """ the [path, data] streams for one relay """
+    globals_text = 'FID=SEL-487E-3-R310-V0-Z0140{:02}-D20170310\r\n'.format(number % 100)
+    globals_text += 'PARTNO=0487E3X1A5X0XXXXXXX\r\nBFID=SLBT-4XX-R209-V0-Z000000-D20150723\r\n'
+    globals_text += setting('RID', relay) + setting('TID', 'SUBSTATION {}'.format(number))
+    globals_text += ''.join(setting('GS{:03}'.format(k), random_value(rng))
+                            for k in range(GLOBAL_SETTINGS))
+
+    group_text = ''.join(setting('G{:03}'.format(k), random_value(rng))
+                         for k in range(GROUP_SETTINGS))
+    group_text += setting('50P1P', '{:f}'.format(rng.uniform(0.5, 20)))
+    group_text += setting('51P1TD', '{:f}'.format(rng.uniform(0.05, 1)))
+
+    port_text = setting('EPORT', 'Y') + setting('MAXACC', '2')
+    port_text += ''.join(setting('PS{:02}'.format(k), random_value(rng))
+                         for k in range(PORT_SETTINGS))
+
+    streams = [['SET_G1.TXT', globals_text],
+               ['SET_1.TXT', group_text],
+               ['SET_L1.TXT', logic_stream(rng, 'P', PROTECTION_LOGIC_LINES)],
+               ['SET_A1.TXT', logic_stream(rng, 'A', AUTOMATION_LOGIC_LINES)],
+               ['SET_P1.TXT', port_text]]
+    for block in range(2, 11):
+        streams.append(['SET_A{}.TXT'.format(block), ''])
+
+    return [[['Relays', relay, name], text.encode('ascii')] for name, text in streams]
+
+def make_rdb(filename, rng, relays=RELAYS_PER_FILE, number=0):
+    streams = []
+    for k in range(relays):
+        streams += relay_streams(rng, 'TYP{}_RELAY{}'.format(number, k), number)
+    write_ole(filename, streams)
+
+def make_corpus(directory, count, seed=0, relays=RELAYS_PER_FILE):
+    """
+    Make sure directory holds count synthetic RDB files, returning their
+    paths. Existing files are kept as the output is deterministic.
+    """
+    os.makedirs(directory, exist_ok=True)
+    files = []
+    for number in range(count):
+        filename = os.path.join(directory, 'synthetic_{:05}.rdb'.format(number))
+        if not os.path.exists(filename):
+            make_rdb(filename, random.Random(seed * 1000003 + number), relays, number)
+        files.append(filename)
+    return files
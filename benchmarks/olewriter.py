@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+"""
+olewriter.py
+A minimal writer for OLE compound files (version 3, 512 byte sectors), enough
+to produce files shaped like RDBs for benchmarking. olefile can only read.
+
+Streams under 4096 bytes go in the mini stream as they do in real files.
+Directory entries are stored as a balanced tree in the order required by the
+compound file specification. Files needing more than 109 FAT sectors
+(roughly 7 MB) are not supported.
+"""
+
+import struct
+
+SECTOR_SIZE = 512
+MINI_SECTOR_SIZE = 64
+MINI_STREAM_CUTOFF = 4096
+FREESECT = 0xFFFFFFFF
+ENDOFCHAIN = 0xFFFFFFFE
+FATSECT = 0xFFFFFFFD
+NOSTREAM = 0xFFFFFFFF
+HEADER_DIFAT_ENTRIES = 109
+
+STGTY_STORAGE = 1
+STGTY_STREAM = 2
+STGTY_ROOT = 5
+
+DIRENTRY_FORMAT = '<64sHBBIII16sIQQIII'
+
+class DirEntry:
+    """ a storage or stream in the compound file """
+
+    def __init__(self, name, entry_type, data=None):
+        self.name = name
+        self.entry_type = entry_type
+        self.data = data
+        self.children = {}
+        self.sid = None
+        self.left = NOSTREAM
+        self.right = NOSTREAM
+        self.child = NOSTREAM
+        self.start = ENDOFCHAIN
+        self.size = 0
+
+    def pack(self):
+        name = self.name.encode('utf-16-le')
+        name_length = len(name) + 2 if name else 0
+        # colour 1 is black
+        return struct.pack(DIRENTRY_FORMAT, name, name_length, self.entry_type, 1,
+                           self.left, self.right, self.child, b'\0' * 16, 0, 0, 0,
+                           self.start, self.size, 0)
+
+def sort_key(entry):
+    # siblings are ordered by name length then upper case name
+    return (len(entry.name), entry.name.upper())
+
+def sectors(size, sector_size=SECTOR_SIZE):
+    return (size + sector_size - 1) // sector_size
+
+def pad(data, sector_size=SECTOR_SIZE):
+    return bytes(data) + b'\0' * (-len(data) % sector_size)
+
+def build_tree(entries):
+    """ link siblings into a balanced binary tree, returning the root sid """
+    if not entries:
+        return NOSTREAM
+    mid = len(entries) // 2
+    entry = entries[mid]
+    entry.left = build_tree(entries[:mid])
+    entry.right = build_tree(entries[mid + 1:])
+    return entry.sid
+
+def write_ole(filename, streams):
+    """
+    Write a compound file containing streams, a list of [path, data] where
+    path is a list of storage names ending with the stream name, e.g.
+    [['Relays', 'TYP123', 'SET_1.TXT'], b'RID,"TYP123"\\x1c\\r\\n']
+    """
+    root = DirEntry('Root Entry', STGTY_ROOT)
+    for path, data in streams:
+        node = root
+        for part in path[:-1]:
+            node = node.children.setdefault(part, DirEntry(part, STGTY_STORAGE))
+        node.children[path[-1]] = DirEntry(path[-1], STGTY_STREAM, data)
+
+    entries = []
+    pending = [root]
+    while pending:
+        node = pending.pop(0)
+        node.sid = len(entries)
+        entries.append(node)
+        pending.extend(node.children.values())
+
+    for entry in entries:
+        if entry.children:
+            entry.child = build_tree(sorted(entry.children.values(), key=sort_key))
+
+    # small streams live in the mini stream, which is the root entry's data
+    mini_stream = bytearray()
+    mini_fat = []
+    big_streams = []
+    for entry in entries:
+        if entry.entry_type != STGTY_STREAM:
+            continue
+        entry.size = len(entry.data)
+        if entry.size >= MINI_STREAM_CUTOFF:
+            big_streams.append(entry)
+        elif entry.size > 0:
+            first = len(mini_fat)
+            count = sectors(entry.size, MINI_SECTOR_SIZE)
+            mini_fat += list(range(first + 1, first + count)) + [ENDOFCHAIN]
+            entry.start = first
+            mini_stream += pad(entry.data, MINI_SECTOR_SIZE)
+
+    dir_sectors = sectors(len(entries) * 128)
+    mini_fat_sectors = sectors(len(mini_fat) * 4)
+    mini_stream_sectors = sectors(len(mini_stream))
+    big_sectors = sum(sectors(e.size) for e in big_streams)
+    other_sectors = dir_sectors + mini_fat_sectors + mini_stream_sectors + big_sectors
+
+    fat_sectors = 1
+    while fat_sectors * SECTOR_SIZE // 4 < fat_sectors + other_sectors:
+        fat_sectors += 1
+    if fat_sectors > HEADER_DIFAT_ENTRIES:
+        raise ValueError('Too much data for a compound file without DIFAT sectors')
+
+    fat = [FATSECT] * fat_sectors
+
+    def allocate(count):
+        first = len(fat)
+        fat.extend(list(range(first + 1, first + count)) + [ENDOFCHAIN])
+        return first
+
+    dir_start = allocate(dir_sectors)
+    mini_fat_start = allocate(mini_fat_sectors) if mini_fat_sectors else ENDOFCHAIN
+    if mini_stream_sectors:
+        root.start = allocate(mini_stream_sectors)
+    root.size = len(mini_stream)
+    for entry in big_streams:
+        entry.start = allocate(sectors(entry.size))
+    fat += [FREESECT] * (fat_sectors * SECTOR_SIZE // 4 - len(fat))
+
+    header = struct.pack('<8s16sHHHHH6sIIIIIIIII',
+                         b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', b'\0' * 16,
+                         0x3E, 3, 0xFFFE, 9, 6, b'\0' * 6,
+                         0, fat_sectors, dir_start, 0, MINI_STREAM_CUTOFF,
+                         mini_fat_start, mini_fat_sectors, ENDOFCHAIN, 0)
+    header += struct.pack('<109I', *(list(range(fat_sectors)) +
+                                     [FREESECT] * (HEADER_DIFAT_ENTRIES - fat_sectors)))
+
+    unused = DirEntry('', 0)
+    directory = b''.join(e.pack() for e in entries)
+    directory += unused.pack() * (dir_sectors * 4 - len(entries))
+
+    with open(filename, 'wb') as f:
+        f.write(header)
+        f.write(struct.pack('<{}I'.format(len(fat)), *fat))
+        f.write(directory)
+        if mini_fat_sectors:
+            f.write(pad(struct.pack('<{}I'.format(len(mini_fat)), *mini_fat)))
+        f.write(pad(mini_stream))
+        for entry in big_streams:
+            f.write(pad(entry.data))
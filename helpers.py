@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
 
 import re
-from collections import OrderedDict
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 from functools import partial
 
 def flatten(l):
@@ -91,6 +94,36 @@ def absolute_backreference(text, n):
 
     return ref_pat.sub(replacer, text)
 
+def build_token_replacer(names):
+    """
+    Like build_replacer but for plain names, e.g. {'PSV01': 'ASV001'}, which are
+    only replaced whole, so PSV1 is left alone inside PSV10. A name ends at
+    anything but a word character or '.', so a definition written without
+    spaces is still renamed:
+
+        {'PSV1': 'PSV2'}: 'PSV10 := PSV1' -> 'PSV10 := PSV2'
+        {'PSV01': 'PSV02'}: 'PSV01:=IN101' -> 'PSV02:=IN101'
+
+    Everything is replaced in one pass so a replacement is never itself
+    replaced again.
+
+    The replacer takes the text and optionally a list to add each name found to.
+    """
+    if not names:
+        return lambda text, found=None: text
+
+    alternatives = '|'.join(re.escape(n) for n in sorted(names, key=len, reverse=True))
+    pattern = re.compile(r'(?<![\w.])(?:' + alternatives + r')(?![\w.])')
+
+    def replacer(text, found=None):
+        def replace(match):
+            if found != None:
+                found.append(match.group())
+            return names[match.group()]
+        return pattern.sub(replace, text)
+
+    return replacer
+
 def multireplace(text, repldict, prefix='', suffix=''):
     new_repldict = {k:prefix + v + suffix for (k,v) in repldict.items()}
     replacer = build_replacer(new_repldict) # must not be regex
@@ -98,4 +131,115 @@ def multireplace(text, repldict, prefix='', suffix=''):
 
 #pattern_to_replacement = {'&&': 'and', '!([a-zA-Z_]+)': r'not \1'}
 #replacer = build_replacer(pattern_to_replacement)
-#print(replacer("!this.exists()"))
\ No newline at end of file
+#print(replacer("!this.exists()"))
+def stop_pool(executor):
+    """ shut down a process pool without waiting, ending any worker stuck on a task """
+    # there is no public way to end a busy worker before Python 3.14
+    processes = list((executor._processes or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+
+def ordered_map(work, items, jobs=1, timeout=None, failed=None):
+    """
+    Yields work(item) for each item in the order given. With more than one
+    job items are spread over a process pool, one item per task, so work must
+    be picklable. A new item is handed to each worker as soon as it is free,
+    results finishing ahead of an earlier item wait in a buffer and no more
+    items are taken once 16 * jobs are waiting or running. items may be a
+    generator, items are only taken from it as they are handed out.
+
+    In the pool an item which raises, runs for longer than timeout seconds or
+    crashes its worker yields failed(item, reason) in its place so the other
+    items carry on, failed None raises instead. A crashed or stuck worker
+    can't be used again, so the items running alongside it start again in a
+    new pool, after a crash one at a time to find which item caused it.
+    """
+    if jobs <= 1:
+        for item in items:
+            yield work(item)
+        return
+
+    def fail(item, reason):
+        if failed == None:
+            raise RuntimeError(reason)
+        return failed(item, reason)
+
+    items = iter(items)
+    more = True
+    taken = 0           # items are numbered in the order taken
+    given = 0           # the number of the next item to yield
+    finished = {}       # number -> result waiting for an earlier item
+    running = {}        # future -> [number, item, start time, alone]
+    again = deque()     # [number, item] to run again after a timeout
+    suspects = deque()  # [number, item] running when a worker crashed
+
+    executor = ProcessPoolExecutor(max_workers=jobs)
+    try:
+        while more or given < taken:
+            while len(running) < jobs and not any(r[3] for r in running.values()):
+                alone = False
+                if again:
+                    [number, item] = again.popleft()
+                elif suspects:
+                    if running:
+                        break
+                    [number, item] = suspects.popleft()
+                    alone = True
+                elif more and taken - given < 16 * jobs:
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        more = False
+                        break
+                    number = taken
+                    taken += 1
+                else:
+                    break
+                future = executor.submit(work, item)
+                running[future] = [number, item, time.monotonic(), alone]
+
+            if running:
+                wait_for = None
+                if timeout != None:
+                    first = min(r[2] for r in running.values())
+                    wait_for = max(0, first + timeout - time.monotonic())
+                wait(running, wait_for, return_when=FIRST_COMPLETED)
+
+            crashed = False
+            stuck = False
+            now = time.monotonic()
+            for future, [number, item, start, alone] in list(running.items()):
+                if future.done():
+                    try:
+                        finished[number] = future.result()
+                        del running[future]
+                    except BrokenProcessPool:
+                        crashed = True
+                    except Exception as e:
+                        finished[number] = fail(item, str(e) or type(e).__name__)
+                        del running[future]
+                elif timeout != None and now - start >= timeout:
+                    stuck = True
+                    finished[number] = fail(item, 'timed out after {} s'.format(timeout))
+                    del running[future]
+
+            if crashed or stuck:
+                for [number, item, start, alone] in running.values():
+                    if not crashed:
+                        again.append([number, item])
+                    elif alone:
+                        finished[number] = fail(item, 'worker crashed')
+                    else:
+                        suspects.append([number, item])
+                running = {}
+                stop_pool(executor)
+                executor = ProcessPoolExecutor(max_workers=jobs)
+
+            while given in finished:
+                yield finished.pop(given)
+                given += 1
+    except BaseException:
+        stop_pool(executor)
+        raise
+    executor.shutdown()
@@ -11,6 +11,8 @@ from __future__ import absolute_import
 import csv
 import re
 
+from collections import Counter
+
 from io import StringIO
 from difflib import Differ
 from  more_itertools import unique_everseen
@@ -21,6 +23,8 @@ import lxml.etree as ET
 import helpers
 import sel_logic_count
 import sel_logic_functions
+from sel_logic_parse import parse_line
+from sel_logic_graph import DependencyGraph, line_operands
 
 
 ERR_START = Fore.RED + Back.LIGHTBLACK_EX + Style.BRIGHT
@@ -109,14 +113,19 @@ class Line:
         self.parent = parent
         self.text = text
         self.type = None
-        self.raw_text = sel_logic_count.removeComment(text).strip()
-        COMMENTS = re.compile(r'^.*?(#+.*$)')
-        comment = COMMENTS.findall(self.text)
-        self.comment = '' if not comment else '' + comment[0].strip()
+        # logic elements used, the variable defined and the names it is defined
+        # from, counted and indexed by the parent only while in its lines
+        self.used = ()
+        self.target = None
+        self.operands = []
+        self.counted = False
+        parsed = parse_line(text)
+        self.raw_text = parsed.code
+        self.comment = parsed.comment
         self.update()
 
     def getLineNum(self):
-        return self.parent.lines.index(self)
+        return self.parent.line_number(self)
 
     def replace(self, first, second, dummyRun=False, etype='equation',):
         new = None
@@ -149,6 +158,23 @@ class Line:
             self.type = 'comment'
         self.text = str(self)
 
+        old = self.used
+        old_target = self.target
+        old_operands = self.operands
+        self.used = sel_logic_count.line_components(sel_logic_count.normalise_line(self.text),
+                                                    False, True)[1]
+        parsed = parse_line(self.raw_text)
+        self.target = parsed.target
+        self.operands = line_operands(parsed)
+        if self.counted:
+            if old != self.used:
+                self.parent.count_usage(old, self.used)
+            if old_target != self.target:
+                self.parent.index_definition(self, old_target, self.target)
+            if old_target != self.target or old_operands != self.operands:
+                self.parent.graph.remove(old_target, old_operands)
+                self.parent.graph.add(self.target, self.operands)
+
     def pretty_print(self, withAliases=False):
         if self.type == 'comment':
             result = '{:<8}        {}'.format(Fore.BLUE + str(self.getLineNum()),
@@ -156,7 +182,7 @@ class Line:
                                               Fore.GREEN + Style.DIM + self.comment +
                                               Fore.RESET + Style.RESET_ALL)
         else:
-            elems = sel_logic_count.countElementsUsed(self.text) - 1
+            elems = parse_line(self.text).elements_used() - 1
             result =  '{:<8} {:>8}    {}'.format(Fore.BLUE + str(self.getLineNum()),
                                                  Fore.LIGHTCYAN_EX + str(elems),
                                                  Fore.WHITE + self.raw_text +
@@ -179,30 +205,103 @@ class LogicLines:
     def __init__(self, text, aliases):
         self.text = text
         self.lines = []
+        # number of lines using each logic element and the variables in use,
+        # kept up to date as lines change so usage needn't be recounted
+        self.usage = Counter()
+        self.variables = sel_logic_count.VariableUsage()
+        # lines defining each variable, and each line's position in lines
+        # which is rebuilt when next needed after lines are added or removed
+        self.definitions = {}
+        self.positions = None
+        # which variables feed which
+        self.graph = DependencyGraph()
         self.aliases = self.get_aliases(aliases)
         self.makeLines()
 
     def makeLines(self):
         all_lines = (self.text.strip()).split('\n')
         for idx, l in enumerate(all_lines):
-            self.lines.append(Line(l, parent=self))
+            self.lines.append(self.track(Line(l, parent=self)))
 
     def addLine(self, text):
-        self.lines.append(Line(text, parent=self))
+        self.lines.append(self.track(Line(text, parent=self)))
         self.text += '\n' + text
 
     def insertLine(self, n, text, comment=''):
-        self.lines.insert(n, Line(text, parent=self))
+        self.lines.insert(n, self.track(Line(text, parent=self)))
         self.text += '\n' + text
         self.comment = ''
         self.updateLines()
 
     def deleteLine(self, line):
         self.lines.remove(line)
+        self.untrack(line)
 
     def deleteLineByIndex(self, n):
+        self.untrack(self.lines[n])
         del self.lines[n]
 
+    def track(self, line):
+        """ start counting the usage of a line added to lines """
+        line.counted = True
+        self.count_usage((), line.used)
+        self.index_definition(line, None, line.target)
+        self.graph.add(line.target, line.operands)
+        self.positions = None
+        return line
+
+    def untrack(self, line):
+        line.counted = False
+        self.count_usage(line.used, ())
+        self.index_definition(line, line.target, None)
+        self.graph.remove(line.target, line.operands)
+        self.positions = None
+
+    def index_definition(self, line, old_target, target):
+        """ move line in the definition index from old_target to target """
+        if old_target != None:
+            defined = self.definitions[old_target]
+            defined.remove(line)
+            if not defined:
+                del self.definitions[old_target]
+        if target != None:
+            self.definitions.setdefault(target, []).append(line)
+
+    def impact(self, names):
+        """
+        Line numbers of the definitions affected by changing any of names,
+        e.g. before converting a timer or changing a variable's type
+        """
+        affected = set()
+        for name in names:
+            affected.add(name)
+            affected.update(self.graph.cone(name))
+        nums = []
+        for name in affected:
+            nums += [self.line_number(l) for l in self.definitions.get(name, [])]
+        return sorted(set(nums))
+
+    def line_number(self, line):
+        if self.positions == None:
+            self.positions = {l: n for n, l in enumerate(self.lines)}
+        return self.positions[line]
+
+    def count_usage(self, removed, added):
+        """ update the usage for a line no longer using removed and now using added """
+        for e in removed:
+            self.usage[e] -= 1
+            if self.usage[e] == 0:
+                del self.usage[e]
+                self.variables.remove([e])
+        for e in added:
+            if e not in self.usage:
+                self.variables.add([e])
+            self.usage[e] += 1
+
+    def used_elements(self):
+        """ sorted logic elements used, as get_logic_usage returns for the text """
+        return sorted(self.usage)
+
     def getDefinitions(self, df):
         """
         returns the line where an element is defined
@@ -211,12 +310,9 @@ class LogicLines:
         Multiple definitions will result in multiple line
         objects being returned
         """
-        result = []
-        for l in self.lines:
-            dfn = l.raw_text.split(':=')[0].strip()
-            #print(dfn)
-            if dfn == df:
-                result.append(l)
+        result = list(self.definitions.get(df, []))
+        if len(result) > 1:
+            result.sort(key=self.line_number)
         return result
 
     def get_aliases(self, aliasCSV):
@@ -230,11 +326,11 @@ class LogicLines:
             return None
 
     def update_aliases(self, arr):
-        update_dict = dict(arr)
+        replacer = helpers.build_token_replacer(dict(arr))
         new_dict = {}
         # done this way to ensure no sequential replacement issues
         for k, v in self.aliases.items():
-            new_dict[helpers.multiple_replace(k, update_dict)] = v
+            new_dict[replacer(k)] = v
         self.aliases = new_dict
 
     def add_alias(self, rwb, alias, description):
@@ -258,21 +354,14 @@ class LogicLines:
         ASV030 := blah
         """
 
-        etypes = sel_logic_count.RDBOperatorsConst.TYPES[df]
-        search_regex = {}
-        for var in etypes:
-            result = sel_logic_count.getRawVariableFromTo(var)
-            search_regex[result[0]] = result[1]
-
-        substrs = sorted(search_regex, key=len, reverse=True)
-        regex_search = re.compile('|'.join(substrs))
-
-        replacer = helpers.build_replacer(search_regex)
+        patterns = sel_logic_count.VARIABLE_PATTERNS[df]
+        regex_search = patterns.search
+        replacer = patterns.replacer
 
         result = []
         result_lines = []
         for l in self.lines:
-            candidate = l.raw_text.split(':=')[0].strip()
+            candidate = l.target or ''
             dfn = regex_search.findall(candidate)
             if dfn:
                 result.append(replacer(candidate))
@@ -289,6 +378,23 @@ class LogicLines:
         self.updateLines()
         return replacements
 
+    def rename(self, names):
+        """
+        Rename variables in every line in one pass, e.g. {'PSV01': 'ASV001'},
+        matching whole names only. Returns the line numbers changed for each name.
+        """
+        replacer = helpers.build_token_replacer(names)
+        changed = {}
+        for num, l in enumerate(self.lines):
+            found = []
+            new = replacer(l.raw_text, found)
+            if new != l.raw_text:
+                l.replace_line(new, keepComment=True)
+                for name in unique_everseen(found):
+                    changed.setdefault(name, []).append(num)
+        self.updateLines()
+        return changed
+
     def multireplace(self, repldict):
         replacer = helpers.build_replacer(repldict) # must not be regex
         for l in self.lines:
@@ -312,13 +418,9 @@ class LogicLines:
         if max == None:
             max = sel_logic_count.RDBOperatorsConst.LIMITS[name][1]
 
-        self.updateLines() # ensure lines are up-to-date
-
-        # this does the heavy lifting
-        used = []
-        if skipUsed:
-            used = sel_logic_count.get_logic_usage(self.text)[1]
-        return sel_logic_count.find_unused_logic(name, used, provideRaw=True, lowestAllowed=min, highestAllowed=max)[0:qty]
+        # usage is kept up to date as lines change
+        usage = self.variables if skipUsed else sel_logic_count.VariableUsage()
+        return usage.next_free(name, qty, lowest=min or None, highest=max or None)
 
     def updateLines(self):
         self.text = str(self)
@@ -347,18 +449,23 @@ class LogicManipulator:
 
         items = sel_logic_functions.makeLogicItems(e)
         # this might just be generic changes
-        result = {}
+        all_changes = []
         for var_to_change in items:
             things_to_change = sel_logic_functions.change_type_vals(var_to_change, to)
             # a (from, to) tuple
             changes = list(zip(things_to_change[0],
                             things_to_change[1]))
             self.history.append(changes)
-            self.l.update_aliases(changes)
-            for c in changes:
-                lchange = self.l.replace(c[0], c[1])
-                if lchange != []:
-                    result[c] = lchange
+            all_changes += changes
+
+        # rename everything at once rather than a pass per variable
+        self.l.update_aliases(all_changes)
+        renamed = self.l.rename(dict(all_changes))
+
+        result = {}
+        for c in all_changes:
+            if c[0] in renamed:
+                result[c] = renamed[c[0]]
         return result
 
     def convert_timers(self, e, from_type, to_type, asv_min=1, asv_max=256):
@@ -392,17 +499,17 @@ class LogicManipulator:
 
             # TODO: FIXME check if there is more than 1, if so error out as a minimum
 
-            try:
-                pu_time = float(pu_def.raw_text.split(':=')[1].strip())
-            except ValueError:
-                pu_time = pu_def.raw_text.split(':=')[1].strip()
-
-            try:
-                do_time = float(do_def.raw_text.split(':=')[1].strip())
-            except ValueError:
-                 do_time = do_def.raw_text.split(':=')[1].strip()
+            # times are numbers or sometimes math variables
+            times = []
+            for d in [pu_def, do_def]:
+                value = parse_line(d.raw_text).value
+                try:
+                    times.append(float(value))
+                except ValueError:
+                    times.append(value)
+            [pu_time, do_time] = times
 
-            in_val = in_def.raw_text.split(':=')[1].strip()
+            in_val = parse_line(in_def.raw_text).value
 
             print('Timer Info: PU: {} DO: {} IN: {}'.format(pu_time,do_time,in_val))
 
@@ -533,7 +640,7 @@ class LogicManipulator:
             for ir in individual_replacements:
                 replacement_dict[ir[0]] = ir[1]
 
-        self.l.multireplace(replacement_dict)
+        self.l.rename(replacement_dict)
         self.l.update_aliases(list(replacement_dict.items()))
 
     def substitute_aliases(d):
@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+
+"""
+rdb_design.py
+Guesses which Transpower standard design each relay was set from, by
+comparing it with a library of reference design RDB files.
+
+Each relay is reduced to a set of features, one per setting in each stream
+(e.g. SET_1.TXT 50P1P=1.00) and one per line of protection and automation
+logic, with whitespace normalised and logic taken without its line number so
+a line inserted near the top doesn't change every line below it. The features
+are hashed into a MinHash signature, NUM_PERM minimums under different hash
+functions, where the fraction of minimums two signatures share estimates the
+Jaccard similarity of their features.
+
+Reference signatures are split into BANDS bands held in an LSH index, so
+classifying a relay only compares it with references sharing at least one band
+rather than with every reference, and signatures can be computed one relay at
+a time over any number of files:
+
+    library = DesignLibrary.from_path('designs')
+    match = library.classify(relay_features(rdb, 'TYP123_DStarNE'))
+    match.label, match.similarity, match.differences
+
+    python rdb_design.py -l designs -j 8 -o csv PATH
+
+In compliance mode every relay is instead checked against one reference relay
+(a template) in the streams of COMPLIANCE_GROUPS. The template holds a digest
+of each reference stream as well as its settings, so a relay stream which is
+byte for byte the reference costs one digest comparison. Only streams whose
+digest differs are parsed and compared setting by setting, and each
+difference is reported as a deviation:
+
+    python rdb_design.py -r template.rdb -o csv PATH
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+
+from collections import namedtuple
+from functools import lru_cache, partial
+
+import numpy as np
+
+import rdbextract
+
+from helpers import ordered_map
+from rdb_file import RdbFile
+from rdb_logic_report import PROTECTION_BLOCKS, AUTOMATION_BLOCKS
+from rdb_section_extract import get_sel_setting
+
+NUM_PERM = 128
+BANDS = 32
+SEED = 1
+
+# settings which identify the relay rather than its design
+SITE_SETTINGS = ['RID', 'TID']
+
+LOGIC_STREAMS = [s for b in PROTECTION_BLOCKS + AUTOMATION_BLOCKS
+                 for s in rdbextract.SEL_FILES_TO_GROUP[b]]
+
+DIFFERENCE_KINDS = ['Settings Changed', 'Only In Relay', 'Only In Design']
+
+HEADERS = ['RDB File', 'Setting Name', 'Design', 'Similarity'] + DIFFERENCE_KINDS
+DIFFERENCE_HEADERS = HEADERS[0:4] + ['Difference', 'Stream', 'Setting', 'Relay Value',
+                                     'Design Value']
+
+COMPLIANCE_GROUPS = ['G1', 'G2', 'G3', 'G4', 'G5', 'G6', 'P1', 'P5', 'PF', 'O1']
+COMPLIANCE_HEADERS = ['RDB File', 'Setting Name', 'Difference', 'Stream', 'Setting',
+                      'Relay Value', 'Reference Value']
+
+Match = namedtuple('Match', ['label', 'similarity', 'differences'])
+
+def make_hash_functions(num_perm=NUM_PERM, seed=SEED):
+    """
+    [a, b] for num_perm multiply-shift hash functions of a 64 bit value x,
+    ((a * x + b) mod 2**64) >> 32, with a odd
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(0, 2**63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    b = rng.integers(0, 2**63, num_perm, dtype=np.uint64)
+    return [a, b]
+
+HASH_FUNCTIONS = make_hash_functions()
+
+def normalise(text):
+    return ' '.join(text.split())
+
+def stream_features(stream, text):
+    """
+    {name: value} for the settings of one stream, logic lines are keyed by
+    the line with a value of None
+    """
+    features = {}
+    for name, value in get_sel_setting(text):
+        if stream in LOGIC_STREAMS:
+            features[normalise(value)] = None
+        elif name not in SITE_SETTINGS:
+            features[name] = normalise(value)
+    return features
+
+def keyed(stream, features):
+    """ stream features keyed by (stream, name) as relay_features are """
+    return {(stream, name): value for name, value in features.items()}
+
+def relay_features(rdb, settings_name):
+    """ {(stream, name): value} for every setting of a relay, see stream_features """
+    features = {}
+    for direntry in rdb.streams(settings_name):
+        if len(direntry) < 3:
+            continue
+        stream = str(direntry[-1]).upper()
+        features.update(keyed(stream, stream_features(stream, rdb.text(direntry, 'utf-8',
+                                                                         'ignore'))))
+    return features
+
+def stream_digest(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+def feature_hashes(features):
+    """ a 64 bit hash of each feature as a uint64 array """
+    hashes = []
+    for [stream, name], value in features.items():
+        text = '\x1c'.join([stream, name, '' if value == None else value])
+        digest = hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest()
+        hashes.append(int.from_bytes(digest, 'little'))
+    return np.array(hashes, dtype=np.uint64)
+
+def signature(features):
+    """ the MinHash signature of features, NUM_PERM uint64 minimums """
+    [a, b] = HASH_FUNCTIONS
+    hashes = feature_hashes(features)
+    if len(hashes) == 0:
+        return np.full(len(a), np.iinfo(np.uint64).max, dtype=np.uint64)
+    # uint64 arithmetic wraps, which is the mod 2**64
+    return ((hashes[:, None] * a + b) >> np.uint64(32)).min(axis=0)
+
+def similarity(first, second):
+    """ estimated Jaccard similarity of the features behind two signatures """
+    return float(np.mean(first == second))
+
+def differences(features, reference):
+    """
+    [kind, stream, name, relay value, design value] for each feature of the
+    relay which isn't as in the reference, kind as in DIFFERENCE_KINDS
+    """
+    result = []
+    for key, value in features.items():
+        if key not in reference:
+            result.append(['Only In Relay', key[0], key[1], value, None])
+        elif reference[key] != value:
+            result.append(['Settings Changed', key[0], key[1], value, reference[key]])
+    for key, value in reference.items():
+        if key not in features:
+            result.append(['Only In Design', key[0], key[1], None, value])
+    return result
+
+class DesignLibrary:
+    """
+    Reference designs indexed by the bands of their MinHash signatures. Each
+    band of rows values is a key into a dict of the references with that band.
+    """
+
+    def __init__(self, bands=BANDS):
+        self.bands = bands
+        self.rows = NUM_PERM // bands
+        self.labels = []
+        self.features = []
+        self.signatures = []
+        self.buckets = [{} for _ in range(bands)]
+
+    def band_keys(self, sig):
+        return [sig[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def add(self, label, features):
+        index = len(self.labels)
+        sig = signature(features)
+        self.labels.append(label)
+        self.features.append(features)
+        self.signatures.append(sig)
+        for bucket, key in zip(self.buckets, self.band_keys(sig)):
+            bucket.setdefault(key, []).append(index)
+
+    def candidates(self, sig):
+        """ the references sharing at least one band with sig """
+        found = set()
+        for bucket, key in zip(self.buckets, self.band_keys(sig)):
+            found.update(bucket.get(key, []))
+        return sorted(found)
+
+    def classify(self, features):
+        """ the Match of the most similar reference, None if nothing is close """
+        sig = signature(features)
+        scored = [[similarity(sig, self.signatures[i]), i] for i in self.candidates(sig)]
+        if not scored:
+            return None
+        [score, best] = max(scored, key=lambda s: s[0])
+        return Match(self.labels[best], score, differences(features, self.features[best]))
+
+    @classmethod
+    def from_path(cls, path, bands=BANDS):
+        """
+        a library of every relay in the RDB files below path, labelled by the
+        file name, with the settings name if the file holds several relays
+        """
+        library = cls(bands)
+        for filename in rdbextract.return_file_paths([path], rdbextract.RDB_EXTENSION):
+            design = os.path.splitext(os.path.basename(filename))[0]
+            with RdbFile(filename) as rdb:
+                settings_names = rdb.settings_names()
+                for settings_name in settings_names:
+                    label = design if len(settings_names) == 1 else design + ':' + settings_name
+                    library.add(label, relay_features(rdb, settings_name))
+        return library
+
+class Template:
+    """
+    The streams of a reference relay in groups, each as a digest of its raw
+    contents and as its settings. settings_name defaults to the first relay
+    in the reference file.
+    """
+
+    def __init__(self, rdb, settings_name=None, groups=COMPLIANCE_GROUPS):
+        names = rdb.settings_names()
+        self.settings_name = settings_name or (names[0] if names else None)
+        if self.settings_name not in names:
+            raise ValueError('No relay {} in {}'.format(self.settings_name, rdb.filename))
+
+        self.names = [s for g in groups for s in rdbextract.SEL_FILES_TO_GROUP[g]]
+        self.digests = {}
+        self.settings = {}
+        for direntry in rdb.streams(self.settings_name, self.names):
+            stream = str(direntry[-1]).upper()
+            self.digests[stream] = stream_digest(rdb.read(direntry))
+            self.settings[stream] = stream_features(stream, rdb.text(direntry, 'utf-8', 'ignore'))
+
+    def deviations(self, rdb, settings_name):
+        """
+        [kind, stream, name, relay value, reference value] for each difference
+        of a relay from the template, as differences gives them
+        """
+        result = []
+        seen = set()
+        for direntry in rdb.streams(settings_name, self.names):
+            stream = str(direntry[-1]).upper()
+            seen.add(stream)
+            if self.digests.get(stream) == stream_digest(rdb.read(direntry)):
+                continue
+            features = stream_features(stream, rdb.text(direntry, 'utf-8', 'ignore'))
+            result += differences(keyed(stream, features),
+                                  keyed(stream, self.settings.get(stream, {})))
+        for stream, settings in self.settings.items():
+            if stream not in seen:
+                result += differences({}, keyed(stream, settings))
+        return result
+
+@lru_cache(maxsize=4)
+def load_template(path, settings_name=None, groups=tuple(COMPLIANCE_GROUPS)):
+    """ the template from the reference RDB file path, built once per process """
+    with RdbFile(path) as rdb:
+        return Template(rdb, settings_name, groups)
+
+@lru_cache(maxsize=4)
+def load_library(path):
+    """ the library for path, built once per process """
+    return DesignLibrary.from_path(path)
+
+def file_designs(filename, library_path):
+    """ [settings name, Match or None] for each relay in an RDB file """
+    library = load_library(library_path)
+    with RdbFile(filename) as rdb:
+        return [[s, library.classify(relay_features(rdb, s))] for s in rdb.settings_names()]
+
+def pad(row, headers):
+    return row + [''] * (len(headers) - len(row))
+
+def design_rows(filename, library_path, details=False):
+    """
+    [summary, differences] for every relay in an RDB file, the summary as
+    HEADERS and with details a row for each difference as DIFFERENCE_HEADERS.
+    This is the unit of work given to each worker process, so it must not
+    raise.
+    """
+    fn = os.path.basename(filename)
+    try:
+        relays = []
+        for settings_name, match in file_designs(filename, library_path):
+            if match == None:
+                relays.append([pad([fn, settings_name, 'Unknown', 0], HEADERS), []])
+                continue
+            row = [fn, settings_name, match.label, round(match.similarity, 3)]
+            counts = [len([d for d in match.differences if d[0] == k]) for k in DIFFERENCE_KINDS]
+            differences = [row + d for d in match.differences] if details else []
+            relays.append([row + counts, differences])
+        return relays
+    except Exception:
+        print('Failed to process file: ' + filename)
+        return [[pad([fn, 'NA', 'Unable to decode rdb file'], HEADERS), []]]
+
+def compliance_rows(filename, reference, settings_name=None, groups=tuple(COMPLIANCE_GROUPS)):
+    """
+    [file, settings name, deviations] for each relay in an RDB file, with
+    deviations None if the file couldn't be read. This is the unit of work
+    given to each worker process, so it must not raise.
+    """
+    fn = os.path.basename(filename)
+    try:
+        template = load_template(reference, settings_name, groups)
+        with RdbFile(filename) as rdb:
+            return [[fn, s, template.deviations(rdb, s)] for s in rdb.settings_names()]
+    except Exception:
+        print('Failed to process file: ' + filename)
+        return [[fn, 'NA', None]]
+
+def format_difference(difference):
+    [kind, stream, name, relay_value, design_value] = difference
+    if kind == 'Settings Changed':
+        return '    {} {}: {} (design {})'.format(stream, name, relay_value, design_value)
+    sign = '+' if kind == 'Only In Relay' else '-'
+    value = relay_value if kind == 'Only In Relay' else design_value
+    if value == None:
+        return '  {} {} {}'.format(sign, stream, name)
+    return '  {} {} {}={}'.format(sign, stream, name, value)
+
+def show_design(relay, output=None, verbose=False):
+    """
+    write a relay's summary to output, with verbose followed by its
+    differences, or show them on the screen
+    """
+    [summary, differences] = relay
+    if output == None:
+        print(' '.join(str(k) for k in summary[0:4]))
+        for d in differences:
+            print(format_difference(d[4:]))
+    elif verbose:
+        output.append(pad(summary[0:4], DIFFERENCE_HEADERS))
+        for d in differences:
+            output.append(d)
+    else:
+        output.append(summary)
+
+def show_compliance(relay, output=None, verbose=False):
+    """ write a relay's deviations to output, or summarise them on the screen """
+    [fn, settings_name, deviations] = relay
+    if output != None:
+        if deviations == None:
+            output.append([fn, settings_name, 'Unable to decode rdb file'])
+        for d in deviations or []:
+            output.append([fn, settings_name] + d)
+        return
+
+    if deviations == None:
+        print('{} {} Unable to decode rdb file'.format(fn, settings_name))
+    elif not deviations:
+        print('{} {} Compliant'.format(fn, settings_name))
+    else:
+        print('{} {} {} deviations'.format(fn, settings_name, len(deviations)))
+        if verbose:
+            for d in deviations:
+                print(format_difference(d))
+
+def main(arg=None):
+    parser = argparse.ArgumentParser(
+        description='Find the closest standard design for every relay in the RDB files'\
+            ' below a path.')
+
+    parser.add_argument('path', metavar='PATH|FILE', nargs='+',
+                       help='Go recursively through PATH looking for .' +
+                       rdbextract.RDB_EXTENSION.lower() + ' files.')
+
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument('-l', '--library', metavar='PATH',
+                      help='Directory of reference design RDB files, one design per file.')
+
+    mode.add_argument('-r', '--reference', metavar='FILE',
+                      help='Check compliance with the template relay in the reference RDB'\
+                      ' FILE, giving a row for each deviation from it.')
+
+    parser.add_argument('--relay', metavar='NAME',
+                        help='Settings name of the template relay in the reference RDB file.'\
+                        ' Default: the first relay')
+
+    parser.add_argument('-g', '--groups', metavar='G', nargs='+', default=COMPLIANCE_GROUPS,
+                        choices=sorted(rdbextract.SEL_FILES_TO_GROUP),
+                        help='Settings groups, ports etc. to check for compliance. Default: ' +
+                        ' '.join(COMPLIANCE_GROUPS))
+
+    parser.add_argument('-o', choices=['csv','xlsx'],
+                        help='Write the report as comma separated values (csv) or as'\
+                        ' an Excel spreadsheet. Otherwise it is shown on the screen.')
+
+    parser.add_argument('-v', '--verbose', action="store_true",
+                        help='Also show each setting and logic line which differs from'\
+                        ' the design or reference. In compliance mode output files always'\
+                        ' have a row for each deviation.')
+
+    parser.add_argument('-j', '--jobs', metavar='N', type=int, default=1,
+                       help='Number of worker processes used to read RDB files.'\
+                       ' Output remains in the original file order.')
+
+    parser.add_argument('-x', '--exclude', metavar='GLOB', type=str, nargs='+',
+                       help='Skip files and directories matching these patterns.')
+
+    parser.add_argument('-m', '--max-depth', metavar='N', type=int, default=None,
+                       help='Maximum directory depth to search below PATH.')
+
+    if arg == None:
+        args = parser.parse_args()
+    else:
+        args = parser.parse_args(arg.split())
+
+    files_to_do = rdbextract.return_file_paths([' '.join(args.path)], rdbextract.RDB_EXTENSION,
+                                               exclude=args.exclude,
+                                               max_depth=args.max_depth)
+
+    if args.reference:
+        groups = tuple(args.groups)
+        try:
+            # once here to complain early, workers load their own
+            load_template(args.reference, args.relay, groups)
+        except Exception as e:
+            print('Unable to read reference file: ' + args.reference + ' ' + str(e))
+            return 1
+        headers = COMPLIANCE_HEADERS
+    else:
+        # with verbose each relay's summary is followed by a row for each difference
+        headers = DIFFERENCE_HEADERS if args.verbose else HEADERS
+
+    output = None
+    if args.o in rdbextract.OUTPUT_WRITERS:
+        output = rdbextract.OUTPUT_WRITERS[args.o](rdbextract.output_filename(args.o), headers)
+
+    if args.reference:
+        work = partial(compliance_rows, reference=args.reference, settings_name=args.relay,
+                       groups=groups)
+    else:
+        work = partial(design_rows, library_path=args.library, details=args.verbose)
+
+    found = False
+    try:
+        for relays in ordered_map(work, files_to_do, args.jobs):
+            found = True
+            for relay in relays:
+                if args.reference:
+                    show_compliance(relay, output, args.verbose)
+                else:
+                    show_design(relay, output, args.verbose)
+    finally:
+        if output != None:
+            output.close()
+
+    if not found:
+        print('Found nothing to do for path: ' + args.path[0])
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
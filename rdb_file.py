@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+"""
+rdb_file.py
+A session on a single RDB file.
+
+The OLE container is opened once and its directory listed once, streams are
+only read when asked for and each is read and decoded at most once. Use it
+as a context manager so the file handle is closed when finished:
+
+    with RdbFile('SEL-487E-3.rdb') as rdb:
+        for direntry in rdb.streams(names=['SET_L1.TXT']):
+            print(rdb.text(direntry))
+"""
+
+from contextlib import nullcontext
+
+import olefile
+
+class RdbFile:
+    """ an open RDB file """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.ole = olefile.OleFileIO(filename)
+        self.listdir = self.ole.listdir()
+        self.data = {}
+        self.decoded = {}
+
+    def streams(self, settingsName=None, names=None):
+        """
+        Returns the directory entries for streams, optionally only for one
+        settings name (relay) and only for settings files in names.
+        Settings files are always Relays > Setting Name > Settings File
+        so names only matches entries at least 3 deep.
+        """
+        listdir = self.listdir
+        if settingsName:
+            listdir = [d for d in listdir if len(d) > 1 and d[1] == settingsName]
+        if names != None:
+            listdir = [d for d in listdir if len(d) >= 3 and str(d[-1]).upper() in names]
+        return listdir
+
+    def settings_names(self):
+        """ returns the settings names (relays) in the file, in order """
+        result = []
+        for d in self.listdir:
+            if len(d) >= 3 and d[1] not in result:
+                result.append(d[1])
+        return result
+
+    def read(self, direntry):
+        """ the raw contents of a stream, read on first use """
+        key = tuple(direntry)
+        if key not in self.data:
+            self.data[key] = self.ole.openstream(direntry).getvalue()
+        return self.data[key]
+
+    def text(self, direntry, encoding='ascii', errors='ignore'):
+        """ the decoded contents of a stream, decoded on first use """
+        key = (tuple(direntry), encoding, errors)
+        if key not in self.decoded:
+            self.decoded[key] = self.read(direntry).decode(encoding, errors=errors)
+        return self.decoded[key]
+
+    def iterate(self, settingsName=None, names=None):
+        """ yields [direntry, data] for each matching stream, reading lazily """
+        for direntry in self.streams(settingsName, names):
+            yield [direntry, self.read(direntry)]
+
+    def close(self):
+        if self.ole != None:
+            self.ole.close()
+            self.ole = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def open_rdb(source):
+    """
+    Context manager for either a filename or an already open RdbFile.
+    An RdbFile passed in is left open for the caller to close.
+    """
+    if isinstance(source, RdbFile):
+        return nullcontext(source)
+    return RdbFile(source)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+
+"""
+rdb_index.py
+A persistent index of the settings held in RDB files so that repeat runs of
+rdbextract.py only reparse files which are new or have changed.
+
+Files are keyed by path and checked by size and modification time, falling
+back to a content hash, so a file copied or touched without changes is not
+reparsed. Every setting in every stream is stored against the relay and
+settings file it came from, so lookups are an SQLite query rather than a
+regex scan of the whole RDB.
+
+Usage:
+    index = RdbIndex('rdb_index.sqlite')
+    index.update('in/SEL-487E-3.rdb')
+    index.lookup('in/SEL-487E-3.rdb', '50P1P', 'G1')
+"""
+
+import os
+import sqlite3
+
+import rdbextract
+
+INDEX_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER,
+    mtime REAL,
+    hash TEXT,
+    readable INTEGER
+);
+CREATE TABLE IF NOT EXISTS settings (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    stream_idx INTEGER NOT NULL,
+    relay TEXT,
+    stream TEXT,
+    kind TEXT,
+    name TEXT,
+    value TEXT,
+    pos INTEGER
+);
+CREATE INDEX IF NOT EXISTS settings_lookup ON settings (file_id, kind, name);
+CREATE INDEX IF NOT EXISTS settings_name ON settings (kind, name);
+"""
+
+def parse_stream(data):
+    """
+    Return all (kind, name, value, pos) settings in a raw stream.
+    kind is 'id' for FID, BFID and PARTNO lines and 'setting' otherwise
+    """
+    [settings, ids] = rdbextract.parse_stream(data)
+    result = []
+    for kind, found in [('setting', settings), ('id', ids)]:
+        for pos, (name, value) in enumerate(found.items()):
+            result.append((kind, name, value, pos))
+    return result
+
+class RdbIndex:
+    """ an on-disk index of RDB settings """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.db = sqlite3.connect(filename)
+        self.db.execute('PRAGMA foreign_keys = ON')
+        version = self.db.execute('PRAGMA user_version').fetchone()[0]
+        if version not in (0, INDEX_VERSION):
+            raise ValueError('Unsupported index version {} in {}'.format(version, filename))
+        self.db.executescript(SCHEMA)
+        self.db.execute('PRAGMA user_version = {}'.format(INDEX_VERSION))
+        self.parsed = 0
+        self.reused = 0
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def file_id(self, filepath):
+        row = self.db.execute('SELECT id FROM files WHERE path = ?',
+                              (os.path.abspath(filepath),)).fetchone()
+        return row[0] if row else None
+
+    def update(self, filepath):
+        """
+        Make sure the index is current for a file, reparsing it only if it is
+        new or its contents have changed. Returns True if it was reparsed.
+        """
+        path = os.path.abspath(filepath)
+        st = os.stat(path)
+        row = self.db.execute('SELECT id, size, mtime, hash FROM files WHERE path = ?',
+                              (path,)).fetchone()
+
+        if row and row[1] == st.st_size and row[2] == st.st_mtime:
+            self.reused += 1
+            return False
+
+        digest = rdbextract.file_hash(path)
+        if row and row[3] == digest:
+            # touched or copied but the same contents
+            self.db.execute('UPDATE files SET size = ?, mtime = ? WHERE id = ?',
+                            (st.st_size, st.st_mtime, row[0]))
+            self.db.commit()
+            self.reused += 1
+            return False
+
+        rdb_info = rdbextract.get_ole_data(filepath)
+
+        with self.db:
+            if row:
+                self.db.execute('DELETE FROM settings WHERE file_id = ?', (row[0],))
+                self.db.execute('UPDATE files SET size = ?, mtime = ?, hash = ?, readable = ?'
+                                ' WHERE id = ?',
+                                (st.st_size, st.st_mtime, digest, int(rdb_info != []), row[0]))
+                fid = row[0]
+            else:
+                cur = self.db.execute('INSERT INTO files (path, size, mtime, hash, readable)'
+                                      ' VALUES (?, ?, ?, ?, ?)',
+                                      (path, st.st_size, st.st_mtime, digest, int(rdb_info != [])))
+                fid = cur.lastrowid
+
+            for stream_idx, stream in enumerate(rdb_info):
+                # Relays > Setting Name > Settings Files
+                if len(stream[0]) < 3:
+                    continue
+                settings_name = str(stream[0][1])
+                stream_name = str(stream[0][-1]).upper()
+                self.db.executemany('INSERT INTO settings VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                    [(fid, stream_idx, settings_name, stream_name) + s
+                                     for s in parse_stream(stream[1])])
+
+        self.parsed += 1
+        return True
+
+    def prune(self):
+        """ remove files from the index which no longer exist """
+        gone = [(r[0],) for r in self.db.execute('SELECT id, path FROM files')
+                if not os.path.exists(r[1])]
+        with self.db:
+            self.db.executemany('DELETE FROM files WHERE id = ?', gone)
+        return len(gone)
+
+    def lookup(self, filepath, setting, group=None):
+        """
+        Find a setting in an indexed file, returning [relay, stream, value] for
+        the first stream containing it (in the order of the RDB), or None.
+        If a group is given only the streams in SEL_FILES_TO_GROUP are searched.
+        """
+        fid = self.file_id(filepath)
+        if fid == None:
+            return None
+        return self._lookup(fid, setting, group)
+
+    def _lookup(self, fid, setting, group=None):
+        kind = 'id' if setting in rdbextract.SEL_ID_SETTINGS else 'setting'
+        sql = 'SELECT relay, stream, value FROM settings WHERE file_id = ? AND kind = ? AND name = ?'
+        params = [fid, kind, setting]
+        if group != None:
+            streams = rdbextract.SEL_FILES_TO_GROUP[group]
+            sql += ' AND stream IN ({})'.format(','.join('?' * len(streams)))
+            params += streams
+        sql += ' ORDER BY stream_idx, pos LIMIT 1'
+        row = self.db.execute(sql, params).fetchone()
+        return list(row) if row else None
+
+    def query(self, setting, group=None):
+        """
+        Look up a setting across every file in the index.
+        Returns a list of [path, relay, stream, value].
+        """
+        kind = 'id' if setting in rdbextract.SEL_ID_SETTINGS else 'setting'
+        sql = ('SELECT f.path, s.relay, s.stream, s.value FROM settings s'
+               ' JOIN files f ON f.id = s.file_id WHERE s.kind = ? AND s.name = ?')
+        params = [kind, setting]
+        if group != None:
+            streams = rdbextract.SEL_FILES_TO_GROUP[group]
+            sql += ' AND s.stream IN ({})'.format(','.join('?' * len(streams)))
+            params += streams
+        sql += ' ORDER BY f.path, s.stream_idx, s.pos'
+        return [list(r) for r in self.db.execute(sql, params)]
+
+    def extract_parameters(self, filepath, args):
+        """
+        Equivalent of rdbextract.extract_parameters answered from the index.
+        The file must have been added with update first.
+        """
+        fn = os.path.basename(filepath)
+        fid = self.file_id(filepath)
+        parameter_info = []
+
+        for k in args.settings:
+            parameter = k.replace(r'"', '')
+            group = None
+            if parameter.find(rdbextract.PARAMETER_SEPARATOR) != -1:
+                [group, parameter] = parameter.split(rdbextract.PARAMETER_SEPARATOR)[0:2]
+
+            found = self._lookup(fid, parameter, group) if fid != None else None
+            if found:
+                parameter_info.append([fn, found[0], found[1], parameter, found[2]])
+            else:
+                parameter_info.append([fn, 'NA', "N/A", parameter, rdbextract.NOT_FOUND])
+
+        return parameter_info
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+"""
+rdb_logic_report.py
+Logic capacity across a fleet of relays, to find the relays closest to their
+protection and automation line and variable limits.
+
+Every RDB file below a path is read and for each relay (settings name) in it
+the logic usage is found for each protection logic group (L1-L9) and for the
+automation logic (A1-A10 together). As in pa_logic_used, the line counts of a
+group are for its protection logic and its variable usage is for the group
+and the automation logic together. Output is one row per relay and block:
+
+    python rdb_logic_report.py -o csv -j 8 PATH
+
+The relays with the fewest free lines are shown at the end.
+"""
+
+import argparse
+import os
+import sys
+
+import rdbextract
+import sel_logic_count
+
+from helpers import ordered_map
+from rdb_file import RdbFile
+from rdb_section_extract import (SEL_FILES_TO_GROUP, LOGIC_INFO, TOTAL_SEL_PROTECTION_LINES,
+                                 TOTAL_SEL_AUTOMATION_LINES, get_sel_setting)
+
+PROTECTION_BLOCKS = ['L' + str(n) for n in range(1, 10)]
+AUTOMATION_BLOCKS = ['A' + str(n) for n in range(1, 11)]
+AUTOMATION = 'A'
+
+HEADERS = ['RDB File', 'Setting Name', 'Block', 'Lines', 'Lines (w/o comments)',
+           'Line Limit', 'Lines Free'] + \
+          [t + ' ' + k for t in LOGIC_INFO for k in ['Used', 'Free']]
+
+DEFAULT_TOP = 10
+
+def read_logic(rdb, settings_name, block):
+    """ the logic of one block as text, None if the relay doesn't have it """
+    for direntry in rdb.streams(settings_name, SEL_FILES_TO_GROUP[block]):
+        text = rdb.text(direntry, 'utf-8', 'ignore')
+        return '\n'.join(s[1] for s in get_sel_setting(text))
+    return None
+
+def usage_row(fn, settings_name, block, lines, variables, limit):
+    """ a row of the report from the usage of the lines and of the variables """
+    used = lines['Lines Used (w/ comment lines)']
+    row = [fn, settings_name, block, used, lines['Lines Used (w/o comment lines)'],
+           limit, limit - used]
+    for t in LOGIC_INFO:
+        qty = int(variables[t]['qty'])
+        row += [qty, variables[t]['total'] - qty]
+    return row
+
+def relay_rows(fn, rdb, settings_name):
+    """ report rows for one relay, its protection groups then its automation """
+    automation = None
+    for block in AUTOMATION_BLOCKS:
+        text = read_logic(rdb, settings_name, block)
+        if text != None:
+            # each block is summarised once and the summaries merged
+            summary = sel_logic_count.UsageSummary(text)
+            automation = summary if automation == None else automation.merge(summary)
+
+    rows = []
+    for block in PROTECTION_BLOCKS:
+        text = read_logic(rdb, settings_name, block)
+        if text == None:
+            continue
+        protection = sel_logic_count.UsageSummary(text)
+        total = protection.merge(automation) if automation != None else protection
+        rows.append(usage_row(fn, settings_name, block,
+                              sel_logic_count.calc_usage_raw(protection),
+                              sel_logic_count.calc_usage_raw(total),
+                              TOTAL_SEL_PROTECTION_LINES))
+
+    if automation != None:
+        usage = sel_logic_count.calc_usage_raw(automation)
+        rows.append(usage_row(fn, settings_name, AUTOMATION, usage, usage,
+                              TOTAL_SEL_AUTOMATION_LINES))
+    return rows
+
+def report_file(filename):
+    """
+    Report rows for every relay in an RDB file. This is the unit of work
+    given to each worker process, so it must not raise.
+    """
+    fn = os.path.basename(filename)
+    try:
+        rows = []
+        with RdbFile(filename) as rdb:
+            for settings_name in rdb.settings_names():
+                rows += relay_rows(fn, rdb, settings_name)
+        return rows
+    except Exception:
+        print('Failed to process file: ' + filename)
+        return [[fn, 'NA', 'Unable to decode rdb file']]
+
+def closest_to_limit(rows, count=DEFAULT_TOP):
+    """ the rows with the smallest fraction of their lines free """
+    reported = [r for r in rows if len(r) == len(HEADERS)]
+    return sorted(reported, key=lambda r: r[6] / r[5])[0:count]
+
+def format_closest(rows):
+    row_format = '{:<30} {:<20} {:<5} {:>6} {:>6} {:>6}'
+    lines = [row_format.format('RDB File', 'Setting Name', 'Block', 'Lines', 'Limit', 'Free')]
+    for r in rows:
+        lines.append(row_format.format(r[0], r[1], r[2], r[3], r[5], r[6]))
+    return '\n'.join(lines)
+
+def main(arg=None):
+    parser = argparse.ArgumentParser(
+        description='Report protection and automation logic usage for every relay in'\
+            ' the RDB files below a path.')
+
+    parser.add_argument('path', metavar='PATH|FILE', nargs='+',
+                       help='Go recursively through PATH looking for .' +
+                       rdbextract.RDB_EXTENSION.lower() + ' files.')
+
+    parser.add_argument('-o', choices=['csv','xlsx'],
+                        help='Write the report as comma separated values (csv) or as'\
+                        ' an Excel spreadsheet. Otherwise only the relays closest to'\
+                        ' their line limits are shown.')
+
+    parser.add_argument('-j', '--jobs', metavar='N', type=int, default=1,
+                       help='Number of worker processes used to read RDB files.'\
+                       ' Output remains in the original file order.')
+
+    parser.add_argument('-x', '--exclude', metavar='GLOB', type=str, nargs='+',
+                       help='Skip files and directories matching these patterns.')
+
+    parser.add_argument('-m', '--max-depth', metavar='N', type=int, default=None,
+                       help='Maximum directory depth to search below PATH.')
+
+    parser.add_argument('-t', '--top', metavar='N', type=int, default=DEFAULT_TOP,
+                       help='Show the N relays with the fewest free lines.'\
+                       ' Default: ' + str(DEFAULT_TOP))
+
+    if arg == None:
+        args = parser.parse_args()
+    else:
+        args = parser.parse_args(arg.split())
+
+    files_to_do = rdbextract.return_file_paths([' '.join(args.path)], rdbextract.RDB_EXTENSION,
+                                               exclude=args.exclude,
+                                               max_depth=args.max_depth)
+
+    output = None
+    if args.o in rdbextract.OUTPUT_WRITERS:
+        output = rdbextract.OUTPUT_WRITERS[args.o](rdbextract.output_filename(args.o), HEADERS)
+
+    all_rows = []
+    try:
+        for rows in ordered_map(report_file, files_to_do, args.jobs):
+            if output != None:
+                for row in rows:
+                    output.append(row)
+            all_rows += rows
+    finally:
+        if output != None:
+            output.close()
+
+    if not all_rows:
+        print('Found nothing to do for path: ' + args.path[0])
+        return 1
+
+    print(format_closest(closest_to_limit(all_rows, args.top)))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
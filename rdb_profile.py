@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+"""
+rdb_profile.py
+Lightweight per-phase timing for rdbextract runs.
+
+Records wall clock time, CPU time, call counts and byte counts for each phase
+of a run (finding files, reading OLE data, decoding, searching settings,
+writing output) and per RDB file. When profiling is off every hook is a
+shared do-nothing object so it costs almost nothing to leave in place.
+
+From rdbextract use --profile (table) or --profile json. From Python:
+
+    import rdb_profile
+    profiler = rdb_profile.enable()
+    rdbextract.main('in --settings RID FID')
+    print(profiler.report())
+    rdb_profile.disable()
+"""
+
+import json
+import time
+
+SLOWEST_FILES = 10
+STATS = ['calls', 'wall', 'cpu', 'bytes']
+
+# order phases are shown in, anything else is shown after these
+PHASES = ['findfiles', 'get_ole_data', 'decode', 'get_stream_parameter', 'output']
+
+class NullPhase:
+    """ stands in for a Phase when profiling is off """
+
+    def add_bytes(self, nbytes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_PHASE = NullPhase()
+
+class Phase:
+    """ times one call of a phase, use as a context manager """
+    __slots__ = ['stats', 'nbytes', 'wall', 'cpu']
+
+    def __init__(self, stats, nbytes=0):
+        self.stats = stats
+        self.nbytes = nbytes
+
+    def add_bytes(self, nbytes):
+        self.nbytes += nbytes
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        self.stats[0] += 1
+        self.stats[1] += time.perf_counter() - self.wall
+        self.stats[2] += time.process_time() - self.cpu
+        self.stats[3] += self.nbytes
+        return False
+
+class Profiler:
+    """ collects [calls, wall, cpu, bytes] per phase and per file """
+
+    def __init__(self):
+        self.phases = {}
+        self.files = {}
+
+    def phase(self, name, nbytes=0):
+        if name not in self.phases:
+            self.phases[name] = [0, 0.0, 0.0, 0]
+        return Phase(self.phases[name], nbytes)
+
+    def file(self, filename):
+        if filename not in self.files:
+            self.files[filename] = [0, 0.0, 0.0, 0]
+        return Phase(self.files[filename])
+
+    def timed(self, name, iterable, size=None):
+        """ yields from iterable, timing each item fetched as one call """
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name) as p:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    # don't count the final empty fetch as a call
+                    self.phases[name][0] -= 1
+                    return
+                if size:
+                    p.add_bytes(size(item))
+            yield item
+
+    def to_dict(self):
+        return {'phases': {k: list(v) for k, v in self.phases.items()},
+                'files': {k: list(v) for k, v in self.files.items()}}
+
+    def merge(self, data):
+        """ add in the results of another profiler, e.g. from a worker """
+        for kind, target in [('phases', self.phases), ('files', self.files)]:
+            for name, stats in data[kind].items():
+                current = target.setdefault(name, [0, 0.0, 0.0, 0])
+                for k in range(4):
+                    current[k] += stats[k]
+
+    def reset(self):
+        self.phases = {}
+        self.files = {}
+
+    def slowest_files(self, count=SLOWEST_FILES):
+        ranked = sorted(self.files.items(), key=lambda f: f[1][1], reverse=True)
+        return ranked[0:count]
+
+    def report(self, fmt='table', slowest=SLOWEST_FILES):
+        if fmt == 'json':
+            data = {}
+            for kind, found in [('phases', self.phases), ('files', self.files)]:
+                data[kind] = {k: dict(zip(STATS, v)) for k, v in found.items()}
+            data['slowest_files'] = [k for k, v in self.slowest_files(slowest)]
+            return json.dumps(data, indent=2)
+
+        names = [p for p in PHASES if p in self.phases] + \
+            sorted(p for p in self.phases if p not in PHASES)
+
+        lines = ['{:<24} {:>9} {:>10} {:>10} {:>10}'.format('Phase', 'Calls', 'Wall (s)',
+                                                         'CPU (s)', 'MB')]
+        for name in names:
+            [calls, wall, cpu, nbytes] = self.phases[name]
+            lines.append('{:<24} {:>9} {:>10.3f} {:>10.3f} {:>10.2f}'.format(
+                name, calls, wall, cpu, nbytes / 1e6))
+
+        if self.files:
+            lines.append('')
+            lines.append('Slowest files ({} of {})'.format(min(slowest, len(self.files)),
+                                                           len(self.files)))
+            lines.append('{:>10} {:>10}  {}'.format('Wall (s)', 'CPU (s)', 'File'))
+            for filename, [calls, wall, cpu, nbytes] in self.slowest_files(slowest):
+                lines.append('{:>10.3f} {:>10.3f}  {}'.format(wall, cpu, filename))
+
+        return '\n'.join(lines)
+
+# the active profiler, None when profiling is off
+profiler = None
+
+def enable():
+    """ start profiling, returning the new Profiler """
+    global profiler
+    profiler = Profiler()
+    return profiler
+
+def disable():
+    global profiler
+    profiler = None
+
+def phase(name, nbytes=0):
+    if profiler == None:
+        return NULL_PHASE
+    return profiler.phase(name, nbytes)
+
+def file(filename):
+    if profiler == None:
+        return NULL_PHASE
+    return profiler.file(filename)
+
+def timed(name, iterable, size=None):
+    if profiler == None:
+        return iterable
+    return profiler.timed(name, iterable, size)
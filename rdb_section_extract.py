@@ -7,13 +7,12 @@ This tool extracts a pile of settings based on the hierachy of Quickset
 """
 
 import collections
-import os
 import re
 
-import olefile
-
 import sel_logic_count
 
+from rdb_file import open_rdb
+
 LINE_INFO = ['Lines Used (w/ comment lines)', 'Lines Used (w/o comment lines)']
 
 LOGIC_INFO = [ 'PSV', 'PMV', 'PLT', 'PCT', 'PST', 'PCN',
@@ -81,25 +80,33 @@ SEL_FILES_TO_GROUP = {
     }
 
 def process_file(filepath, args, settingsName=None):
-    rdb_info = get_ole_data(filepath, settingsName=settingsName)
+    """
+    Returns [settings name, text] for the first stream for the settings
+    file args. filepath can be a path or an open RdbFile, in which case the
+    stream is only read once however often it is asked for.
+    """
+    # only the streams for this settings file can match so don't read the rest
+    rdb_info = get_ole_data(filepath, settingsName, SEL_FILES_TO_GROUP[args], first=True)
     return extract_parameters(filepath, rdb_info, args)
 
-def get_ole_data(filepath,settingsName=None):
+def get_ole_data(filepath,settingsName=None, streams=None, first=False):
+    """
+    Read streams from an RDB file, optionally restricted to a settings name
+    and to stream names in streams. If first is set stop after the first
+    matching stream.
+    """
     data = []
-    listdir = []
     try:
-        ole = olefile.OleFileIO(filepath)
-        listdir = ole.listdir()
-        if settingsName:
-            listdir = [l for l in listdir if l[1]==settingsName]
-        for direntry in listdir:
-            data.append([direntry, ole.openstream(direntry).getvalue()])
+        with open_rdb(filepath) as rdb:
+            for stream in rdb.iterate(settingsName, streams):
+                data.append(stream)
+                if first:
+                    break
     except:
-        print('Failed to read streams in file: ' + filepath)
+        print('Failed to read streams in file: ' + str(filepath))
     return data
 
 def extract_parameters(filepath, rdb_info, txtfile):
-    fn = os.path.basename(filepath)
     parameter_info=[]
 
     for stream in rdb_info:
@@ -247,29 +254,32 @@ def sum_logic_usage_multiple_groups(d, group_title='Group', settings_name=None,
 
 def get_logic(filepath, *names, settingsName=None):
     logics = {}
-    for name in names:
-        [settings_name, output] = process_file(filepath, name, settingsName)
-        lines = get_sel_setting(output)
-        result = []
-        for settings in lines:
-            result.append(settings[1])
-        logic_text = "\n".join(result)
-        logics[name] = logic_text
+    with open_rdb(filepath) as rdb:
+        for name in names:
+            [settings_name, output] = process_file(rdb, name, settingsName)
+            lines = get_sel_setting(output)
+            result = []
+            for settings in lines:
+                result.append(settings[1])
+            logic_text = "\n".join(result)
+            logics[name] = logic_text
     return logics
 
 def get_logic_total(path, groups, includeAutomation=True, settings_name=None):
-    # get logic for number of protection 
-    groups_new = ['L' + str(g) for g in groups]
-    protection = get_logic(path, *groups_new, settingsName=settings_name)
-    
-    automation_arr = []
-    if includeAutomation:
-        for block in range(1,10+1):
-            #print(get_logic(path, 'A' + str(block)))
-            automation_arr.append(get_logic(path, 'A' + str(block), settingsName=settings_name)['A' + str(block)])
-        automation = '\n'.join(automation_arr)
-        return [protection, automation]
-    
+    # open once for all protection and automation blocks
+    with open_rdb(path) as rdb:
+        # get logic for number of protection 
+        groups_new = ['L' + str(g) for g in groups]
+        protection = get_logic(rdb, *groups_new, settingsName=settings_name)
+
+        automation_arr = []
+        if includeAutomation:
+            for block in range(1,10+1):
+                #print(get_logic(path, 'A' + str(block)))
+                automation_arr.append(get_logic(rdb, 'A' + str(block), settingsName=settings_name)['A' + str(block)])
+            automation = '\n'.join(automation_arr)
+            return [protection, automation]
+
     return [protection]
 
 def plogic_used(filepath, group_prefix, settings_name, *nums):
@@ -286,7 +296,9 @@ def pa_logic_used(filepath, group_prefix, settings_name, *nums):
     logics = get_logic_total(filepath, nums, includeAutomation=True, settings_name=settings_name)
     LINES = ['Lines Used (w/ comment lines)', 'Lines Used (w/o comment lines)']
     
-    automation = sel_logic_count.calc_usage_raw(logics[1])
+    # summarise each block once, totals come from merging the summaries
+    automation_usage = sel_logic_count.UsageSummary(logics[1])
+    automation = sel_logic_count.calc_usage_raw(automation_usage)
     automation = {k:v for (k,v) in automation.items() if k in LINES}
     automation = {'A': automation}
     
@@ -295,10 +307,11 @@ def pa_logic_used(filepath, group_prefix, settings_name, *nums):
 
     for group in nums:
         # print(group)
-        pg = sel_logic_count.calc_usage_raw(logics[0]['L' + str(group)])
+        protection_usage = sel_logic_count.UsageSummary(logics[0]['L' + str(group)])
+        pg = sel_logic_count.calc_usage_raw(protection_usage)
         protection['L' + str(group)] = {k:v for (k,v) in pg.items() if k in LINES}
                 
-        tg = sel_logic_count.calc_usage_raw(logics[0]['L' + str(group)] + '\n' + logics[1])
+        tg = sel_logic_count.calc_usage_raw(protection_usage.merge(automation_usage))
         total['L' + str(group)] = {k:v for (k,v) in tg.items() if k not in LINES}
         
     #print('p',protection, 'a', automation, 't', total)
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+"""
+rdb_spare_logic.py
+Logic variables free on every relay of a fleet, so a new logic module can be
+given variable numbers (e.g. a block of PSVs and PLTs) which one settings
+template can use everywhere.
+
+Every RDB file below a path is read and for each relay (settings name) the
+variables used by any of its protection (L1-L9) or automation (A1-A10) logic
+are kept as a packed bit array per type, one row per relay:
+
+    PSV  relay 0  01101000 00000000 ...    bit n set when PSVn is used
+         relay 1  01000100 00000000 ...
+
+ORing the rows gives the variables used anywhere and so, as for a single
+relay with find_unused_logic, the variables free on every relay:
+
+    python rdb_spare_logic.py -j 8 -n 4 PATH
+
+    PSV   Free on every relay:  18 / 64    Available: 47-64
+          First 4: PSV47, PSV48, PSV49, PSV50
+
+Summing the rows instead counts the relays using each variable, so -u N shows
+the variables which only N or fewer relays would need changing to free up.
+Relays without any logic are skipped and counted separately.
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+
+import rdbextract
+import sel_logic_count
+
+from helpers import ordered_map
+from rdb_file import RdbFile
+from rdb_logic_report import PROTECTION_BLOCKS, AUTOMATION_BLOCKS, read_logic
+from intervals import provide_string_range
+from rdb_section_extract import LOGIC_INFO
+
+def pack(bits, type):
+    """ a VariableUsage bitset of type as a uint8 array, bit n of bits is bit n of the array """
+    size = sel_logic_count.RDBOperatorsConst.LIMITS[type][1] // 8 + 1
+    return np.frombuffer(bits.to_bytes(size, 'little'), dtype=np.uint8)
+
+def unpack(array):
+    return int.from_bytes(array.tobytes(), 'little')
+
+def relay_usage(rdb, settings_name):
+    """ VariableUsage of everything used by the logic of one relay, None if it has none """
+    usage = None
+    for block in PROTECTION_BLOCKS + AUTOMATION_BLOCKS:
+        text = read_logic(rdb, settings_name, block)
+        if text != None:
+            usage = usage or sel_logic_count.VariableUsage()
+            usage.add(sel_logic_count.UsageSummary(text).logic_elements)
+    return usage
+
+def file_usage(filename):
+    """
+    [relays, skipped] for an RDB file, relays is [file, settings name,
+    {type: packed bits}] for each relay with logic and skipped the number of
+    relays without any. This is the unit of work given to each worker
+    process, so it must not raise.
+    """
+    fn = os.path.basename(filename)
+    try:
+        relays = []
+        skipped = 0
+        with RdbFile(filename) as rdb:
+            for settings_name in rdb.settings_names():
+                usage = relay_usage(rdb, settings_name)
+                if usage != None:
+                    packed = {t: pack(usage.used_bits(t), t) for t in LOGIC_INFO}
+                    relays.append([fn, settings_name, packed])
+                else:
+                    skipped += 1
+        return [relays, skipped]
+    except Exception:
+        print('Failed to process file: ' + filename)
+        return [[], 0]
+
+class SpareMatrix:
+    """
+    The variables used by each relay of a fleet, a uint8 matrix per type with
+    a row of packed bits for each relay
+    """
+
+    def __init__(self):
+        self.relays = []
+        self.rows = {t: [] for t in LOGIC_INFO}
+        self.matrices = {}
+
+    def add(self, fn, settings_name, packed):
+        self.relays.append([fn, settings_name])
+        for t in LOGIC_INFO:
+            self.rows[t].append(packed[t])
+        self.matrices = {}
+
+    def matrix(self, type):
+        """ [relay, byte] of packed bits for type """
+        if type not in self.matrices:
+            size = len(pack(0, type))
+            self.matrices[type] = np.array(self.rows[type], dtype=np.uint8).reshape(-1, size)
+        return self.matrices[type]
+
+    def used_anywhere(self):
+        """ VariableUsage of the variables used by any relay """
+        usage = sel_logic_count.VariableUsage()
+        for t in LOGIC_INFO:
+            usage.bits[t] = unpack(np.bitwise_or.reduce(self.matrix(t), axis=0))
+        return usage
+
+    def relays_using(self, type):
+        """ the number of relays using each variable number of type """
+        bits = np.unpackbits(self.matrix(type), axis=1, bitorder='little')
+        return bits.sum(axis=0)
+
+    def used_by_at_most(self, type, count):
+        """ bits set for the variables of type used by at most count relays """
+        numbers = np.flatnonzero(self.relays_using(type) <= count)
+        return sum(1 << int(n) for n in numbers) & sel_logic_count.limit_mask(type)
+
+def format_spare(matrix, types=LOGIC_INFO, first=0, used_by=None):
+    usage = matrix.used_anywhere()
+    lines = []
+    for t in types:
+        total = sel_logic_count.RDBOperatorsConst.LIMITS[t][1]
+        lines.append('{:<5} Free on every relay: {:>3} / {:<4}  Available: {}'.format(
+            t, usage.free_count(t), total,
+            sel_logic_count.find_unused_logic(t, None, usage=usage)))
+        if first:
+            lines.append('      First {}: {}'.format(first, ', '.join(usage.next_free(t, first))))
+        if used_by != None:
+            few = sel_logic_count.bit_ranges(matrix.used_by_at_most(t, used_by))
+            lines.append('      Used by at most {} relays: {}'.format(used_by,
+                                                                   provide_string_range(few)))
+    return '\n'.join(lines)
+
+def main(arg=None):
+    parser = argparse.ArgumentParser(
+        description='Find the logic variables free on every relay in the RDB files'\
+            ' below a path.')
+
+    parser.add_argument('path', metavar='PATH|FILE', nargs='+',
+                       help='Go recursively through PATH looking for .' +
+                       rdbextract.RDB_EXTENSION.lower() + ' files.')
+
+    parser.add_argument('-t', '--types', metavar='TYPE', nargs='+', choices=LOGIC_INFO,
+                        default=LOGIC_INFO,
+                        help='Variable types to show, e.g. PSV PLT. Default: all')
+
+    parser.add_argument('-n', '--first', metavar='N', type=int, default=0,
+                        help='Also list the first N variables of each type free on every relay.')
+
+    parser.add_argument('-u', '--used-by', metavar='N', type=int, default=None,
+                        help='Also list the variables of each type used by at most N relays,'\
+                        ' which would only need those relays changed to be free everywhere.')
+
+    parser.add_argument('-j', '--jobs', metavar='N', type=int, default=1,
+                       help='Number of worker processes used to read RDB files.')
+
+    parser.add_argument('-x', '--exclude', metavar='GLOB', type=str, nargs='+',
+                       help='Skip files and directories matching these patterns.')
+
+    parser.add_argument('-m', '--max-depth', metavar='N', type=int, default=None,
+                       help='Maximum directory depth to search below PATH.')
+
+    if arg == None:
+        args = parser.parse_args()
+    else:
+        args = parser.parse_args(arg.split())
+
+    files_to_do = rdbextract.return_file_paths([' '.join(args.path)], rdbextract.RDB_EXTENSION,
+                                               exclude=args.exclude,
+                                               max_depth=args.max_depth)
+
+    matrix = SpareMatrix()
+    skipped = 0
+    for relays, without_logic in ordered_map(file_usage, files_to_do, args.jobs):
+        skipped += without_logic
+        for relay in relays:
+            matrix.add(*relay)
+
+    if not matrix.relays:
+        print('Found nothing to do for path: ' + args.path[0])
+        return 1
+
+    print('Relays: {}, {} without logic skipped'.format(len(matrix.relays), skipped))
+    print(format_spare(matrix, args.types, args.first, args.used_by))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
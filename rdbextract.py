@@ -1,383 +1,790 @@
-#!/usr/bin/env python3
-
-"""
-rdbextract.py
-A tool to browse SEL AcSELerator Quickset RDB files to extract parameter
-information intended for bulk processing.
-
-Usage defined by running with option -h.
-
-This tool can be run from the IDLE prompt using the start def, e.g.
-start('-h') or start('start.rdb G1:50P1P')
-
-Installation instructions (for Python 3):
- - pip install tablib olefile
-
-TODO:
- - include settings group which parameter is used in:
-  code like this could be used:
-    print "used in: "
-    print re.findall('^' + SEL_SETTING_NAME + ",\"" +
-                   SEL_EXPRESSION + sys.argv[1] + SEL_EXPRESSION
-                   + "\"" + SEL_SETTING_EOL,
-                   rdat, flags=re.MULTILINE)
- - sorting options on display and dump output?
- - sort out guessing of Transpower standard design version
- - sort out handling of protection and automation logic in 400 series
-"""
-
-import sys
-import os
-import argparse
-import fnmatch
-import glob
-import re
-
-from itertools import zip_longest
-from pathlib import Path
-
-import tablib
-import olefile
-
-from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
-
-__version__ = "GratefulDead"
-
-RDB_EXTENSION = 'RDB'
-BASE_PATH = os.path.dirname(os.path.realpath(__file__))
-PARAMETER_SEPARATOR = ':'
-
-SEL_EXPRESSION = r'[\w :+/\\()!,.\-_\\*#]*'
-SEL_SETTING_EOL = r'\x1c\r\n'
-# these seem to be the options
-# this needs to be verified
-SEL_SETTING_EOL = r'(\r\n|\x1c\r\n)'
-# presently using this as covers all cases.
-# this seems to work differently to others: SEL-421-4 LineProt Std Rev01.rdb
-SEL_SETTING_EOL = r''
-SEL_SETTING_NAME = r'[\w _]*'
-SEL_FID_EXPRESSION='^FID=([\w :+/\\()!,.\-_\\*]{10,})\r\n'
-SEL_PARTNO_EXPRESSION='^PARTNO=([\w :+/\\()!,.\-_\\*]{10,})\r\n'
-SEL_BFID_EXPRESSION='^BFID=([\w :+/\\()!,.\-_\\*]{10,})\r\n'
-
-OUTPUT_FILE_NAME = "output"
-NOT_FOUND = 'Not Found'
-
-# this probably needs to be expanded
-SEL_FILES_TO_GROUP = {
-    'G': ['SET_G1'],
-    'G1': ['SET_S1.TXT', 'SET_L1.TXT', 'SET_1.TXT'], # Groups
-    'G2': ['SET_S2.TXT', 'SET_L2.TXT', 'SET_2.TXT'],
-    'G3': ['SET_S3.TXT', 'SET_L3.TXT', 'SET_3.TXT'],
-    'G4': ['SET_S4.TXT', 'SET_L4.TXT', 'SET_4.TXT'],
-    'G5': ['SET_S5.TXT', 'SET_L5.TXT', 'SET_5.TXT'],
-    'G6': ['SET_S6.TXT', 'SET_L6.TXT', 'SET_6.TXT'],
-
-    'P1': ['SET_P1.TXT'], # Ports
-    'P2': ['SET_P2.TXT'],
-    'P3': ['SET_P3.TXT'],
-    'P5': ['SET_P5.TXT'],
-    'PF': ['SET_PF.TXT'], # Front Port
-    'P87': ['SET_P87.TXT'], # Differential Port Settings
-
-    'A1': ['SET_A1.TXT'], # Automation
-    'A2': ['SET_A2.TXT'],
-    'A3': ['SET_A3.TXT'],
-    'A4': ['SET_A4.TXT'],
-    'A5': ['SET_A5.TXT'],
-    'A6': ['SET_A6.TXT'],
-    'A7': ['SET_A7.TXT'],
-    'A8': ['SET_A8.TXT'],
-    'A9': ['SET_A9.TXT'],
-    'A10': ['SET_A10.TXT'],
-
-    'L1': ['SET_L1.TXT'], # Protection Logic
-    'L2': ['SET_L2.TXT'],
-    'L3': ['SET_L3.TXT'],
-    'L4': ['SET_L4.TXT'],
-    'L5': ['SET_L5.TXT'],
-    'L6': ['SET_L6.TXT'],
-    'L7': ['SET_L7.TXT'],
-    'L8': ['SET_L8.TXT'],
-    'L9': ['SET_L9.TXT'],
-
-
-    'B1': ['SET_B1.TXT'], # Bay Control information
-
-    'D1': ['SET_D1.TXT'], # DNP
-    'D2': ['SET_D2.TXT'],
-    'D3': ['SET_D3.TXT'],
-    'D4': ['SET_D4.TXT'],
-    'D5': ['SET_D5.TXT'],
-
-    'F1': ['SET_F1.TXT'], # Front Panel
-    'M1': ['SET_M1.TXT'], # CB Monitoring
-    'N1': ['SET_N1.TXT'], # Notes
-    'O1': ['SET_O1.TXT'], # Outputs
-    'R1': ['SET_R1.TXT'], # SER
-    'T1': ['SET_R1.TXT'], # Aliases
-
-    }
-
-OUTPUT_HEADERS = ['RDB File','Name','Setting File','Setting Name','Val']
-
-def main(arg=None):
-    parser = argparse.ArgumentParser(
-        description='Process individual or multiple RDB files and produce summary'\
-            ' of results as a csv or xls file.',
-        epilog='Enjoy. Bug reports and feature requests welcome. Feel free to build a GUI :-)',
-        prefix_chars='-/')
-
-    parser.add_argument('-o', choices=['csv','xlsx'],
-                        help='Produce output as either comma separated values (csv) or as'\
-                        ' a Micro$oft Excel .xls spreadsheet. If no output provided then'\
-                        ' output is to the screen.')
-    # ' '.join(opts.dmp) 1
-    parser.add_argument('path', metavar='PATH|FILE', nargs='+',
-                       help='Go recursively go through path PATH. Redundant if FILE'\
-                       ' with extension .rdb is used. When recursively called, only'\
-                       ' searches for files with:' +  RDB_EXTENSION + '. Globbing is'\
-                       ' allowed with the * and ? characters.')
-
-    parser.add_argument('-c', '--console', action="store_true",
-                       help='Show output to console')
-
-    # Not implemented yet
-    #parser.add_argument('-d', '--design', action="store_true",
-    #                   help='Attempt to determine Transpower standard design version and' \
-    #                   ' include this information in output')
-
-    parser.add_argument('-s', '--settings', metavar='G:S', type=str, nargs='+',
-                       help='Settings in the form of G:S where G is the group'\
-                       ' and S is the SEL variable name. If G: is omitted the search' \
-                       ' goes through all groups. Otherwise G should be the '\
-                       ' group of interest. S should be the setting name ' \
-                       ' e.g. OUT201.' \
-                       ' Examples: G1:50P1P or G2:50P1P or 50P1P' \
-                       ' '\
-                       ' You can also get port settings using P:S'
-                       ' Note: Applying a group for a non-grouped setting is unnecessary'\
-                       ' and will prevent you from receiving results.'\
-                       ' '\
-                       ' Special arguments include: FID')
-
-    parser.add_argument('-v', '--version', action='version', version='%(prog)s ' + __version__)
-
-    if arg == None:
-        args = parser.parse_args()
-    else:
-        args = parser.parse_args(arg.split())
-
-    files_to_do = return_file_paths([' '.join(args.path)], RDB_EXTENSION)
-
-    if files_to_do != []:
-        process_rdb_files(files_to_do, args)
-    else:
-        print('Found nothing to do for path: ' + args.path[0])
-        sys.exit()
-        os.system("Pause")
-
-def findfiles(which, where='.'):
-    '''Returns list of filenames from `where` path matched by 'which'
-       shell pattern. Matching is case-insensitive.'''
-    
-    # TODO: recursive param with walk() filtering
-    rule = re.compile(fnmatch.translate(which), re.IGNORECASE)
-    return [os.path.join(where, name) for name in os.listdir(where) if rule.match(name)]
-
-def return_file_paths(args_path, file_extension):
-
-    return findfiles('*.' + file_extension.lower(), args_path[0].replace('"', ''))
-
-    """fpath = args_path[0].replace(r'"', '')
-
-    if fpath == ".":
-        files = list(Path('.').glob('**/*.' + file_extension.lower()))
-        
-    else:
-        files = Path(fpath).resolve().glob('*.rdb')
-
-    return [str(f) for f in files]
-    """
-
-def grouper(iterable, n, fillvalue=None):
-    args = [iter(iterable)] * n
-    return zip_longest(*args, fillvalue=fillvalue)
-
-def process_rdb_files(files_to_do, args):
-    parameter_info = []
-
-    for filename in files_to_do:
-        # print filename
-        rdb_info = get_ole_data(filename)
-        new_data = extract_parameters(filename, rdb_info, args)
-        parameter_info += new_data
-
-    data = tablib.Dataset(headers=['filename'] + args.settings)
-
-    # group output data by parameter
-    grouped = grouper(parameter_info, len(args.settings), '')
-
-    for file_data in grouped:
-        data.append([file_data[0][0]] + [k[-1] for k in file_data])
-
-    # don't overwrite existing file
-    name = OUTPUT_FILE_NAME
-    if args.o == 'csv' or args.o == 'xlsx':
-        # this is stupid and klunky but hey
-        while os.path.exists(name + '.csv') or os.path.exists(name + '.xlsx'):
-            name += '_'
-
-    # write data
-    if args.o == None:
-        pass
-    elif args.o == 'csv':
-        with open(name + '.csv', 'wb') as output:
-            output.write(data.csv)
-    elif args.o == 'xlsx':
-        with open(name + '.xlsx', 'wb') as output:
-            output.write(data.xlsx)
-
-    if args.console == True:
-        display_info(parameter_info)
-
-def get_ole_data(filename):
-    data = []
-    try:
-        ole = olefile.OleFileIO(filename)
-        listdir = ole.listdir()
-        for direntry in listdir:
-            data.append([direntry, ole.openstream(direntry).getvalue()])
-    except:
-        print('Failed to read streams in file: ' + filename)
-    return data
-
-def fix_string(text):
-    return re.sub(ILLEGAL_CHARACTERS_RE, '', text)
-
-def extract_parameters(filename, rdb_info, args):
-    fn = os.path.basename(filename)
-    parameter_info=[]
-
-    parameter_list = []
-    for k in args.settings:
-        parameter_list.append(k.replace(r'"', '')) #.translate(None, '\"'))
-
-    # iterate across all parameters the user specified
-    for parameter in parameter_list:
-        category_file_list = None
-        search_parameter = ''
-
-        # is it a parameter associated wtih a group?
-        if parameter.find(PARAMETER_SEPARATOR) != -1:
-            category_file_list = \
-                SEL_FILES_TO_GROUP[(parameter.split(PARAMETER_SEPARATOR))[0]]
-            search_parameter = parameter.split(PARAMETER_SEPARATOR)[1]
-        else:
-            search_parameter = parameter
-
-        # print search_parameter
-        # iterate over stream in rdb file
-        for stream in rdb_info:
-            return_value = []
-            settings_name = str(stream[0][1])
-            stream_name = str(stream[0][-1]).upper()
-
-            # lookup for group to file to restrict examination
-            # parameters are always:
-            # Relays > Setting Name > Settings Files
-            # so length is always at least 3
-            if len(stream[0]) >= 3 and \
-                (category_file_list == None \
-                or stream[0][-1].upper() in category_file_list):
-
-                if search_parameter == 'FID':
-                    try:
-                        return_value = extract_fid(stream[1].decode('ascii', errors="ignore"))
-                    except:
-                        return_value = "Unable to decode rdb file"
-                elif search_parameter == 'BFID':
-                    try:
-                        return_value = extract_bfid(stream[1].decode('ascii', errors="ignore"))
-                    except:
-                        return_value = "Unable to decode rdb file"
-
-                elif search_parameter == 'PARTNO':
-                    try:
-                        return_value = extract_partno(stream[1].decode('ascii', errors="ignore"))
-                    except:
-                        return_value = "Unable to decode rdb file"
-
-                else:
-                    try:
-                        return_value = get_stream_parameter(search_parameter,
-                                                            stream[1].decode('ascii', errors="ignore"))
-                    except:
-                        return_value = "Unable to decode rdb file"
-
-            if return_value != []:
-                parameter_info.append([fn, settings_name, \
-                    stream_name, search_parameter, return_value[0]])
-                break
-
-        else:
-            parameter_info.append([fn, 'NA',\
-                    "N/A", search_parameter, NOT_FOUND])
-
-    return parameter_info
-
-def extract_fid(stream):
-    # FIDs look like this for example:
-    return re.findall(SEL_FID_EXPRESSION, \
-        stream, flags=re.MULTILINE)
-
-def extract_bfid(stream):
-    # FIDs look like this for example:
-    return re.findall(SEL_BFID_EXPRESSION, \
-        stream, flags=re.MULTILINE)
-
-def extract_partno(stream):
-    # PARTNOs look like this for example:
-    return re.findall(SEL_PARTNO_EXPRESSION, \
-        stream, flags=re.MULTILINE)
-
-
-def get_stream_parameter(parameter, stream):
-    return re.findall('^' + parameter + \
-        ",\"(" + SEL_EXPRESSION + ")\"" + \
-        SEL_SETTING_EOL, \
-        stream, flags=re.MULTILINE)
-
-def display_info(parameter_info):
-    lengths = []
-    # first pass to determine column widths:
-    for line in parameter_info:
-        for index,element in enumerate(line):
-            try:
-                lengths[index] = max(lengths[index], len(element))
-            except IndexError:
-                lengths.append(len(element))
-
-    parameter_info.insert(0,OUTPUT_HEADERS)
-    # now display in columns
-    for line in parameter_info:
-        display_line = ''
-        for index,element in enumerate(line):
-            display_line += element.ljust(lengths[index]+2,' ')
-        print(display_line)
-
-if __name__ == '__main__':
-    if len(sys.argv) == 1 :
-        # main(r'-o xlsx --console "in\SEL-421-4 LineProt Std Rev01.rdb" --settings "RID TID G1:81D1P 81D1T 81D2P 81D2T TR FID"')
-        # main(r'-o xlsx --console "in\SEL-421-4 LineProt Std Rev01.rdb" --settings "TR"')
-        #main(r'-o xlsx "in/other/SEL-351S-6-R5 Standard Rev01 (2).rdb" --settings "RID TID SID G1:81D1P G1:81D1T 81D2P 81D2T TR FID"')
-        # main(r'-o xlsx "W:\Education\Current\Stationware Dump\20150511\SI" --settings "RID TID SID G1:81D1P G1:81D1D 81D2P 81D2D TR FID"')
-        # main(r'-o xlsx "in/other/SEL-351S-6-R5 Standard Rev01 (2).rdb" --settings "RID TID SID G1:81D1P G1:81D1T 81D2P 81D2T TR FID"')
-        # main(r'-o xlsx "W:\Education\Current\Stationware Dump\20150511\SI" --settings "RID TID SID G1:81D1P G1:81D1D 81D2P 81D2D TR FID"')
-        # main(r'-o xlsx "W:\Education\Current\Stationware Dump\20150511\" --settings "RID TID G1:51P1P G1:51P1TD G1:51P1C TR FID"')
-        # W:\Education\Current\Stationware Dump
-        #main(r'-o xlsx "/media/mulhollandd/KINGSTON/stationware/rdb" --settings "RID TID FID"')
-        main(r'-o xlsx "/media/mulhollandd/KINGSTON/stationware/rdb" --settings "RID TID SID FID PARTNO BFID"')
-
-    else:
-        main()
+#!/usr/bin/env python3
+
+"""
+rdbextract.py
+A tool to browse SEL AcSELerator Quickset RDB files to extract parameter
+information intended for bulk processing.
+
+Usage defined by running with option -h.
+
+This tool can be run from the IDLE prompt using the start def, e.g.
+start('-h') or start('start.rdb G1:50P1P')
+
+Installation instructions (for Python 3):
+ - pip install openpyxl olefile
+ - pip install numpy (only for --design, which uses rdb_design.py)
+
+TODO:
+ - include settings group which parameter is used in:
+  code like this could be used:
+    print "used in: "
+    print re.findall('^' + SEL_SETTING_NAME + ",\"" +
+                   SEL_EXPRESSION + sys.argv[1] + SEL_EXPRESSION
+                   + "\"" + SEL_SETTING_EOL,
+                   rdat, flags=re.MULTILINE)
+ - sorting options on display and dump output?
+ - sort out handling of protection and automation logic in 400 series
+"""
+
+import sys
+import os
+import argparse
+import csv
+import fnmatch
+import hashlib
+import re
+
+from collections import OrderedDict
+from functools import partial
+from itertools import chain, zip_longest
+
+from openpyxl import Workbook
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+import rdb_profile
+
+from helpers import ordered_map
+from rdb_file import RdbFile
+
+__version__ = "GratefulDead"
+
+RDB_EXTENSION = 'RDB'
+BASE_PATH = os.path.dirname(os.path.realpath(__file__))
+PARAMETER_SEPARATOR = ':'
+
+SEL_EXPRESSION = r'[\w :+/\\()!,.\-_\\*#]*'
+SEL_SETTING_EOL = r'\x1c\r\n'
+# these seem to be the options
+# this needs to be verified
+SEL_SETTING_EOL = r'(\r\n|\x1c\r\n)'
+# presently using this as covers all cases.
+# this seems to work differently to others: SEL-421-4 LineProt Std Rev01.rdb
+SEL_SETTING_EOL = r''
+SEL_SETTING_NAME = r'[\w _]*'
+SEL_FID_EXPRESSION='^FID=([\w :+/\\()!,.\-_\\*]{10,})\r\n'
+SEL_PARTNO_EXPRESSION='^PARTNO=([\w :+/\\()!,.\-_\\*]{10,})\r\n'
+SEL_BFID_EXPRESSION='^BFID=([\w :+/\\()!,.\-_\\*]{10,})\r\n'
+
+# used to read every setting in a stream in one pass
+SEL_SETTINGS_EXPRESSION = re.compile('^(' + SEL_SETTING_NAME + ')' + \
+    ",\"(" + SEL_EXPRESSION + ")\"" + SEL_SETTING_EOL, flags=re.MULTILINE)
+SEL_ID_EXPRESSION = re.compile('^(FID|BFID|PARTNO)=([\w :+/\\()!,.\-_\\*]{10,})\r\n', \
+    flags=re.MULTILINE)
+SEL_ID_SETTINGS = ['FID', 'BFID', 'PARTNO']
+
+OUTPUT_FILE_NAME = "output"
+HASH_BLOCK_SIZE = 1 << 20
+DEDUP_CACHE_SIZE = 1000
+NOT_FOUND = 'Not Found'
+
+# this probably needs to be expanded
+SEL_FILES_TO_GROUP = {
+    'G': ['SET_G1'],
+    'G1': ['SET_S1.TXT', 'SET_L1.TXT', 'SET_1.TXT'], # Groups
+    'G2': ['SET_S2.TXT', 'SET_L2.TXT', 'SET_2.TXT'],
+    'G3': ['SET_S3.TXT', 'SET_L3.TXT', 'SET_3.TXT'],
+    'G4': ['SET_S4.TXT', 'SET_L4.TXT', 'SET_4.TXT'],
+    'G5': ['SET_S5.TXT', 'SET_L5.TXT', 'SET_5.TXT'],
+    'G6': ['SET_S6.TXT', 'SET_L6.TXT', 'SET_6.TXT'],
+
+    'P1': ['SET_P1.TXT'], # Ports
+    'P2': ['SET_P2.TXT'],
+    'P3': ['SET_P3.TXT'],
+    'P5': ['SET_P5.TXT'],
+    'PF': ['SET_PF.TXT'], # Front Port
+    'P87': ['SET_P87.TXT'], # Differential Port Settings
+
+    'A1': ['SET_A1.TXT'], # Automation
+    'A2': ['SET_A2.TXT'],
+    'A3': ['SET_A3.TXT'],
+    'A4': ['SET_A4.TXT'],
+    'A5': ['SET_A5.TXT'],
+    'A6': ['SET_A6.TXT'],
+    'A7': ['SET_A7.TXT'],
+    'A8': ['SET_A8.TXT'],
+    'A9': ['SET_A9.TXT'],
+    'A10': ['SET_A10.TXT'],
+
+    'L1': ['SET_L1.TXT'], # Protection Logic
+    'L2': ['SET_L2.TXT'],
+    'L3': ['SET_L3.TXT'],
+    'L4': ['SET_L4.TXT'],
+    'L5': ['SET_L5.TXT'],
+    'L6': ['SET_L6.TXT'],
+    'L7': ['SET_L7.TXT'],
+    'L8': ['SET_L8.TXT'],
+    'L9': ['SET_L9.TXT'],
+
+
+    'B1': ['SET_B1.TXT'], # Bay Control information
+
+    'D1': ['SET_D1.TXT'], # DNP
+    'D2': ['SET_D2.TXT'],
+    'D3': ['SET_D3.TXT'],
+    'D4': ['SET_D4.TXT'],
+    'D5': ['SET_D5.TXT'],
+
+    'F1': ['SET_F1.TXT'], # Front Panel
+    'M1': ['SET_M1.TXT'], # CB Monitoring
+    'N1': ['SET_N1.TXT'], # Notes
+    'O1': ['SET_O1.TXT'], # Outputs
+    'R1': ['SET_R1.TXT'], # SER
+    'T1': ['SET_R1.TXT'], # Aliases
+
+    }
+
+OUTPUT_HEADERS = ['RDB File','Name','Setting File','Setting Name','Val']
+
+def main(arg=None):
+    parser = argparse.ArgumentParser(
+        description='Process individual or multiple RDB files and produce summary'\
+            ' of results as a csv or xls file.',
+        epilog='Enjoy. Bug reports and feature requests welcome. Feel free to build a GUI :-)',
+        prefix_chars='-/')
+
+    parser.add_argument('-o', choices=['csv','xlsx'],
+                        help='Produce output as either comma separated values (csv) or as'\
+                        ' a Micro$oft Excel .xls spreadsheet. If no output provided then'\
+                        ' output is to the screen.')
+    # ' '.join(opts.dmp) 1
+    parser.add_argument('path', metavar='PATH|FILE', nargs='+',
+                       help='Go recursively go through path PATH. Redundant if FILE'\
+                       ' with extension .rdb is used. When recursively called, only'\
+                       ' searches for files with:' +  RDB_EXTENSION + '. Globbing is'\
+                       ' allowed with the * and ? characters.')
+
+    parser.add_argument('-c', '--console', action="store_true",
+                       help='Show output to console')
+
+    parser.add_argument('--design', metavar='PATH', type=str,
+                       help='Determine the closest Transpower standard design of each relay'\
+                       ' from the reference design RDB files in PATH and include it, with'\
+                       ' its similarity, as a DESIGN column in output.')
+
+    parser.add_argument('-s', '--settings', metavar='G:S', type=str, nargs='+',
+                       help='Settings in the form of G:S where G is the group'\
+                       ' and S is the SEL variable name. If G: is omitted the search' \
+                       ' goes through all groups. Otherwise G should be the '\
+                       ' group of interest. S should be the setting name ' \
+                       ' e.g. OUT201.' \
+                       ' Examples: G1:50P1P or G2:50P1P or 50P1P' \
+                       ' '\
+                       ' You can also get port settings using P:S'
+                       ' Note: Applying a group for a non-grouped setting is unnecessary'\
+                       ' and will prevent you from receiving results.'\
+                       ' '\
+                       ' Special arguments include: FID')
+
+    parser.add_argument('-i', '--include', metavar='GLOB', type=str, nargs='+',
+                       help='Only process files matching these patterns. Defaults to'\
+                       ' *.' + RDB_EXTENSION.lower() + '. Matching is case-insensitive.')
+
+    parser.add_argument('-x', '--exclude', metavar='GLOB', type=str, nargs='+',
+                       help='Skip files and directories matching these patterns,'\
+                       ' either by name or by path relative to PATH.'\
+                       ' e.g. -x Archive "*old*"')
+
+    parser.add_argument('-m', '--max-depth', metavar='N', type=int, default=None,
+                       help='Maximum directory depth to search below PATH. 0 only'\
+                       ' searches PATH itself. Default is no limit.')
+
+    parser.add_argument('-j', '--jobs', metavar='N', type=int, default=1,
+                       help='Number of worker processes used to read and search'\
+                       ' RDB files. Output remains in the original file order.'\
+                       ' Defaults to 1 (no worker processes).')
+
+    parser.add_argument('-t', '--timeout', metavar='SECONDS', type=float, default=600,
+                       help='With --jobs, give up on an RDB file after SECONDS and'\
+                       ' report it as unreadable so other files carry on. Default: 600')
+
+    parser.add_argument('-d', '--dedup', action="store_true",
+                       help='Only read one copy of byte-identical RDB files. Results are'\
+                       ' repeated for every copy and a summary of the files skipped'\
+                       ' is shown at the end.')
+
+    parser.add_argument('--index', metavar='FILE', type=str,
+                       help='Keep an index of RDB settings in the SQLite database FILE.'\
+                       ' Only new or changed RDB files are read, everything else is'\
+                       ' answered from the index. Files are processed in a single'\
+                       ' process when this is used.')
+
+    parser.add_argument('--profile', nargs='?', const='table', choices=['table', 'json'],
+                       help='Report time, CPU time, calls and bytes for each phase of'\
+                       ' the run and the slowest files, as a table (default) or json.')
+
+    parser.add_argument('-v', '--version', action='version', version='%(prog)s ' + __version__)
+
+    if arg == None:
+        args = parser.parse_args()
+    else:
+        args = parser.parse_args(arg.split())
+
+    if args.profile:
+        profiler = rdb_profile.enable()
+
+    files_to_do = return_file_paths([' '.join(args.path)], RDB_EXTENSION,
+                                    include=args.include,
+                                    exclude=args.exclude,
+                                    max_depth=args.max_depth)
+    files_to_do = rdb_profile.timed('findfiles', files_to_do)
+
+    # peek at the first file so we can complain early, without waiting for
+    # the whole tree to be walked
+    first_file = next(files_to_do, None)
+
+    if first_file != None:
+        process_rdb_files(chain([first_file], files_to_do), args)
+        if args.profile:
+            print(profiler.report(args.profile))
+            rdb_profile.disable()
+    else:
+        print('Found nothing to do for path: ' + args.path[0])
+        sys.exit()
+        os.system("Pause")
+
+def compile_patterns(patterns):
+    '''Returns compiled case-insensitive regexes for a shell pattern or
+       list of shell patterns.'''
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    return [re.compile(fnmatch.translate(p), re.IGNORECASE) for p in patterns or []]
+
+def matches_any(rules, *names):
+    return any(rule.match(name) for rule in rules for name in names)
+
+def findfiles(which, where='.', exclude=None, max_depth=None):
+    '''Yields filenames below `where` path matched by 'which' shell
+       pattern(s) as they are found. Matching is case-insensitive.
+
+       Directories are walked depth first with os.scandir so the first files
+       are available before the rest of the tree has been listed. Anything
+       (file or directory) matching an 'exclude' pattern, either by name or by
+       path relative to `where`, is skipped. A max_depth of 0 only looks in
+       `where` itself, None has no limit.'''
+
+    rules = compile_patterns(which)
+    excludes = compile_patterns(exclude)
+
+    if os.path.isfile(where):
+        if matches_any(rules, os.path.basename(where)):
+            yield where
+        return
+
+    stack = [(where, 0)]
+    while stack:
+        directory, depth = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda e: e.name.lower())
+        except OSError as err:
+            print('Unable to list directory: ' + directory + ' (' + str(err) + ')')
+            continue
+
+        subdirs = []
+        for entry in entries:
+            relative = os.path.relpath(entry.path, where)
+            if matches_any(excludes, entry.name, relative):
+                continue
+            try:
+                if entry.is_dir():
+                    subdirs.append(entry.path)
+                elif matches_any(rules, entry.name):
+                    yield entry.path
+            except OSError:
+                continue
+
+        if max_depth == None or depth < max_depth:
+            # reversed so directories come off the stack in sorted order
+            stack.extend((d, depth + 1) for d in reversed(subdirs))
+
+def return_file_paths(args_path, file_extension, include=None, exclude=None, max_depth=None):
+    '''Yields the paths of all files to process. By default this is every
+       file with the given extension below the path.'''
+    which = include if include else '*.' + file_extension.lower()
+    return findfiles(which, args_path[0].replace('"', ''),
+                     exclude=exclude, max_depth=max_depth)
+
+def grouper(iterable, n, fillvalue=None):
+    args = [iter(iterable)] * n
+    return zip_longest(*args, fillvalue=fillvalue)
+
+def process_rdb_file(filename, args):
+    '''Read and search a single RDB file. This is the unit of work given to
+       each worker process when running with --jobs so it must not raise,
+       otherwise the rows for the output go out of step.'''
+    try:
+        with rdb_profile.file(filename):
+            # only open the streams that could hold what was asked for, and
+            # stop reading once everything has been found
+            [_, streams] = plan_parameters(args)
+            rdb_info = rdb_profile.timed('get_ole_data', iterate_ole_data(filename, streams),
+                                         size=lambda stream: len(stream[1]))
+            return with_design(extract_parameters(filename, rdb_info, args), filename, args)
+    except Exception:
+        return failed_rows(filename, args)
+
+def failed_rows(filename, args, reason='Unable to decode rdb file'):
+    '''The rows for a file which couldn't be read, one per setting'''
+    print('Failed to process file: ' + filename)
+    fn = os.path.basename(filename)
+    return [[fn, 'NA', 'N/A', k.replace(r'"', '').split(PARAMETER_SEPARATOR)[-1],
+             reason] for k in output_settings(args)]
+
+def output_settings(args):
+    '''The settings asked for, and DESIGN if the design is to be found'''
+    return args.settings + (['DESIGN'] if getattr(args, 'design', None) else [])
+
+def with_design(parameter_info, filename, args):
+    '''Adds a DESIGN row after the parameters with the closest standard
+       design and its similarity for each relay in the file'''
+    if not getattr(args, 'design', None):
+        return parameter_info
+
+    import rdb_design
+    fn = os.path.basename(filename)
+    try:
+        with rdb_profile.phase('design'):
+            designs = rdb_design.file_designs(filename, args.design)
+    except Exception:
+        return parameter_info + [[fn, 'NA', 'N/A', 'DESIGN', 'Unable to decode rdb file']]
+
+    found = []
+    for settings_name, match in designs:
+        design = 'Unknown' if match == None else \
+            '{} ({:.0%})'.format(match.label, match.similarity)
+        found.append(design if len(designs) == 1 else settings_name + ': ' + design)
+    return parameter_info + [[fn, ', '.join(d[0] for d in designs) or 'NA', 'N/A',
+                              'DESIGN', '; '.join(found) or NOT_FOUND]]
+
+def process_rdb_file_profiled(filename, args):
+    '''process_rdb_file for a worker process when profiling, returning
+       [parameters, profile] so the worker's timings can be merged.'''
+    profiler = rdb_profile.enable()
+    try:
+        return [process_rdb_file(filename, args), profiler.to_dict()]
+    finally:
+        rdb_profile.disable()
+
+def read_rdb_file(item, args, profiled=False):
+    '''The task for each [filename, original] from iterate_rdb_files,
+       returning [filename, original, parameters, profile]. A copy of an
+       original file isn't read and has no parameters, profile is only
+       given when profiled.'''
+    [filename, original] = item
+    if original != None:
+        return [filename, original, None, None]
+    if profiled:
+        return [filename, None] + process_rdb_file_profiled(filename, args)
+    return [filename, None, process_rdb_file(filename, args), None]
+
+def failed_rdb_file(item, reason, args):
+    '''read_rdb_file's result for a file whose worker failed or timed out'''
+    [filename, original] = item
+    return [filename, original, failed_rows(filename, args, 'Unable to read rdb file: ' + reason),
+            None]
+
+def file_hash(filename):
+    '''sha1 of the file contents, read in blocks'''
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class DuplicateFinder:
+    '''Recognises byte-identical copies of files already seen.
+
+       Files are grouped by size first and only hashed once a second file
+       of the same size turns up, so files with a unique size are never
+       read for hashing.'''
+
+    def __init__(self):
+        # size -> list of [filename, hash or None if not yet hashed]
+        self.sizes = {}
+        # size -> number of files seen with that size
+        self.counts = {}
+        self.files = 0
+        self.duplicates = 0
+        self.bytes_skipped = 0
+
+    def original(self, filename):
+        '''Returns the first file seen with identical contents to filename,
+           or None if it is the first of its kind.'''
+        self.files += 1
+        try:
+            size = os.path.getsize(filename)
+        except OSError:
+            return None
+
+        self.counts[size] = self.counts.get(size, 0) + 1
+        candidates = self.sizes.setdefault(size, [])
+        if candidates == []:
+            candidates.append([filename, None])
+            return None
+
+        try:
+            digest = file_hash(filename)
+            for candidate in candidates:
+                if candidate[1] == None:
+                    candidate[1] = file_hash(candidate[0])
+                if candidate[1] == digest:
+                    self.duplicates += 1
+                    self.bytes_skipped += size
+                    return candidate[0]
+        except OSError:
+            return None
+
+        candidates.append([filename, digest])
+        return None
+
+    def shared(self, filename):
+        '''True if another file seen so far has the same size as filename,
+           so it could have a copy'''
+        try:
+            return self.counts.get(os.path.getsize(filename), 0) > 1
+        except OSError:
+            return False
+
+    def read_again(self, filename):
+        '''A copy found by original was read after all'''
+        self.duplicates -= 1
+        self.bytes_skipped -= os.path.getsize(filename)
+
+    def summary(self):
+        return 'Duplicates: {} of {} files were identical copies,'\
+            ' {:.1f} MB not parsed'.format(self.duplicates, self.files,
+                                           self.bytes_skipped / 1e6)
+
+def relabel(parameter_info, filename):
+    '''Copy of a file's results with the filename replaced'''
+    fn = os.path.basename(filename)
+    return [[fn] + k[1:] for k in parameter_info]
+
+def iterate_rdb_files(files_to_do, args):
+    '''Yields the extracted parameters for each file in the order given.
+       With more than one job the files are spread over a process pool one
+       file per task, so a slow or corrupt file only holds up its own worker.
+       A file taking longer than args.timeout seconds, or crashing its
+       worker, gives failed rows instead. files_to_do may be a generator,
+       files are only taken from it as they are handed to a worker so
+       discovery and extraction overlap.
+       With dedup the results of the first copy of a file are reused for
+       any identical copies. Results are only kept for the latest
+       DEDUP_CACHE_SIZE files sharing their size with another file, a copy
+       of a file whose results weren't kept is read again.'''
+    jobs = getattr(args, 'jobs', 1) or 1
+
+    finder = DuplicateFinder() if getattr(args, 'dedup', False) else None
+
+    def with_originals():
+        for filename in files_to_do:
+            yield [filename, finder.original(filename) if finder else None]
+
+    if getattr(args, 'index', None):
+        import rdb_index
+        with rdb_index.RdbIndex(args.index) as index:
+            for filename, original in with_originals():
+                if original == None:
+                    with rdb_profile.file(filename):
+                        index.update(filename)
+                        new_data = with_design(index.extract_parameters(filename, args),
+                                               filename, args)
+                    yield new_data
+                else:
+                    yield relabel(with_design(index.extract_parameters(original, args),
+                                              original, args), filename)
+            print('Index: {} files read, {} unchanged'.format(index.parsed, index.reused))
+    else:
+        # worker processes have their own profiler, merged in here
+        profiler = rdb_profile.profiler
+        work = partial(read_rdb_file, args=args, profiled=jobs > 1 and profiler != None)
+        results = OrderedDict()
+        failed = partial(failed_rdb_file, args=args)
+        timeout = getattr(args, 'timeout', None)
+        for filename, original, new_data, profile in ordered_map(work, with_originals(), jobs,
+                                                                 timeout, failed):
+            if original != None:
+                if original in results:
+                    results.move_to_end(original)
+                    yield relabel(results[original], filename)
+                else:
+                    finder.read_again(filename)
+                    yield process_rdb_file(filename, args)
+                continue
+            if profile != None:
+                profiler.merge(profile)
+            if finder and finder.shared(filename):
+                results[filename] = new_data
+                if len(results) > DEDUP_CACHE_SIZE:
+                    results.popitem(last=False)
+            yield new_data
+
+    if finder:
+        print(finder.summary())
+
+class CsvOutput:
+    '''Writes output rows to a csv file as they arrive. Each row is flushed
+       so the file is complete up to the last processed RDB file.'''
+
+    def __init__(self, filename, headers):
+        self.file = open(filename, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.append(headers)
+
+    def append(self, row):
+        self.writer.writerow(row)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class XlsxOutput:
+    '''Writes output rows to an xlsx file using an openpyxl write-only
+       workbook, so rows are not held in memory. An xlsx file can only be
+       written in one go, so it is saved on close including when the run
+       fails part way through.'''
+
+    def __init__(self, filename, headers):
+        self.filename = filename
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet()
+        self.append(headers)
+
+    def append(self, row):
+        self.sheet.append([fix_string(str(k)) for k in row])
+
+    def close(self):
+        self.workbook.save(self.filename)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+OUTPUT_WRITERS = {'csv': CsvOutput, 'xlsx': XlsxOutput}
+
+def output_filename(extension):
+    # don't overwrite existing file
+    name = OUTPUT_FILE_NAME
+    # this is stupid and klunky but hey
+    while os.path.exists(name + '.csv') or os.path.exists(name + '.xlsx'):
+        name += '_'
+    return name + '.' + extension
+
+def process_rdb_files(files_to_do, args):
+    # only kept for the console, output files are written a row at a time
+    parameter_info = []
+
+    output = None
+    if args.o in OUTPUT_WRITERS:
+        output = OUTPUT_WRITERS[args.o](output_filename(args.o),
+                                        ['filename'] + output_settings(args))
+
+    try:
+        for new_data in iterate_rdb_files(files_to_do, args):
+            # one row per file, one column per parameter
+            if output != None:
+                with rdb_profile.phase('output'):
+                    output.append([new_data[0][0]] + [k[-1] for k in new_data])
+
+            if args.console == True:
+                parameter_info += new_data
+    finally:
+        if output != None:
+            with rdb_profile.phase('output'):
+                output.close()
+
+    if args.console == True:
+        display_info(parameter_info)
+
+def get_ole_data(filename, streams=None):
+    return list(iterate_ole_data(filename, streams))
+
+def iterate_ole_data(filename, streams=None):
+    '''Yields [direntry, data] for streams in an RDB file, only reading a
+       stream when it is asked for. If streams is given only settings
+       streams with those names are read.'''
+    rdb = None
+    try:
+        rdb = RdbFile(filename)
+        for stream in rdb.iterate(names=streams):
+            yield stream
+    except GeneratorExit:
+        raise
+    except:
+        print('Failed to read streams in file: ' + filename)
+    finally:
+        if rdb != None:
+            rdb.close()
+
+def plan_parameters(args):
+    '''Work out what is being searched for. Returns a list of
+       [category_file_list, search_parameter] for each requested setting and
+       the set of stream names which could contain any of them, or None if
+       any settings stream could.'''
+    plan = []
+    streams = set()
+
+    for k in args.settings:
+        parameter = k.replace(r'"', '') #.translate(None, '\"'))
+        category_file_list = None
+
+        # is it a parameter associated wtih a group?
+        if parameter.find(PARAMETER_SEPARATOR) != -1:
+            category_file_list = \
+                SEL_FILES_TO_GROUP[(parameter.split(PARAMETER_SEPARATOR))[0]]
+            search_parameter = parameter.split(PARAMETER_SEPARATOR)[1]
+        else:
+            search_parameter = parameter
+
+        plan.append([category_file_list, search_parameter])
+        if streams != None and category_file_list != None:
+            streams.update(category_file_list)
+        else:
+            streams = None
+
+    return [plan, streams]
+
+def fix_string(text):
+    return re.sub(ILLEGAL_CHARACTERS_RE, '', text)
+
+def extract_parameters(filename, rdb_info, args):
+    '''For each requested setting find the first stream (in RDB order)
+       that contains it. rdb_info can be a list or a lazy iterator from
+       iterate_ole_data, each stream is parsed at most once and no more
+       streams are taken once every setting has been found.'''
+    fn = os.path.basename(filename)
+
+    [plan, _] = plan_parameters(args)
+    found = [None] * len(plan)
+    remaining = len(plan)
+
+    # iterate over stream in rdb file
+    for stream in rdb_info:
+        if remaining == 0:
+            break
+
+        # lookup for group to file to restrict examination
+        # parameters are always:
+        # Relays > Setting Name > Settings Files
+        # so length is always at least 3
+        if len(stream[0]) < 3:
+            continue
+
+        settings_name = str(stream[0][1])
+        stream_name = str(stream[0][-1]).upper()
+        parsed = False
+
+        for index, [category_file_list, search_parameter] in enumerate(plan):
+            if found[index] != None or \
+                (category_file_list != None and stream_name not in category_file_list):
+                continue
+
+            if parsed == False:
+                try:
+                    parsed = parse_stream(stream[1])
+                except:
+                    parsed = None
+
+            if parsed == None:
+                return_value = "Unable to decode rdb file"
+            else:
+                [settings, ids] = parsed
+                lookup = ids if search_parameter in SEL_ID_SETTINGS else settings
+                return_value = lookup.get(search_parameter)
+
+            if return_value != None:
+                found[index] = [fn, settings_name, \
+                    stream_name, search_parameter, return_value]
+                remaining -= 1
+
+    parameter_info = []
+    for index, [category_file_list, search_parameter] in enumerate(plan):
+        if found[index] != None:
+            parameter_info.append(found[index])
+        else:
+            parameter_info.append([fn, 'NA',\
+                    "N/A", search_parameter, NOT_FOUND])
+
+    return parameter_info
+
+def parse_stream(data):
+    '''Parse a raw settings stream once, returning [settings, ids] where
+       each is a dict of setting name to value. Where a setting occurs more
+       than once the first value is kept, as get_stream_parameter would.'''
+    with rdb_profile.phase('decode', len(data)):
+        text = data.decode('ascii', errors="ignore")
+
+    with rdb_profile.phase('get_stream_parameter', len(text)):
+        settings = {}
+        for name, value in SEL_SETTINGS_EXPRESSION.findall(text):
+            settings.setdefault(name, value)
+
+        ids = {}
+        for name, value in SEL_ID_EXPRESSION.findall(text):
+            ids.setdefault(name, value)
+
+    return [settings, ids]
+
+def extract_fid(stream):
+    # FIDs look like this for example:
+    return re.findall(SEL_FID_EXPRESSION, \
+        stream, flags=re.MULTILINE)
+
+def extract_bfid(stream):
+    # FIDs look like this for example:
+    return re.findall(SEL_BFID_EXPRESSION, \
+        stream, flags=re.MULTILINE)
+
+def extract_partno(stream):
+    # PARTNOs look like this for example:
+    return re.findall(SEL_PARTNO_EXPRESSION, \
+        stream, flags=re.MULTILINE)
+
+
+def get_stream_parameter(parameter, stream):
+    return re.findall('^' + parameter + \
+        ",\"(" + SEL_EXPRESSION + ")\"" + \
+        SEL_SETTING_EOL, \
+        stream, flags=re.MULTILINE)
+
+def display_info(parameter_info):
+    lengths = []
+    # first pass to determine column widths:
+    for line in parameter_info:
+        for index,element in enumerate(line):
+            try:
+                lengths[index] = max(lengths[index], len(element))
+            except IndexError:
+                lengths.append(len(element))
+
+    parameter_info.insert(0,OUTPUT_HEADERS)
+    # now display in columns
+    for line in parameter_info:
+        display_line = ''
+        for index,element in enumerate(line):
+            display_line += element.ljust(lengths[index]+2,' ')
+        print(display_line)
+
+if __name__ == '__main__':
+    if len(sys.argv) == 1 :
+        # main(r'-o xlsx --console "in\SEL-421-4 LineProt Std Rev01.rdb" --settings "RID TID G1:81D1P 81D1T 81D2P 81D2T TR FID"')
+        # main(r'-o xlsx --console "in\SEL-421-4 LineProt Std Rev01.rdb" --settings "TR"')
+        #main(r'-o xlsx "in/other/SEL-351S-6-R5 Standard Rev01 (2).rdb" --settings "RID TID SID G1:81D1P G1:81D1T 81D2P 81D2T TR FID"')
+        # main(r'-o xlsx "W:\Education\Current\Stationware Dump\20150511\SI" --settings "RID TID SID G1:81D1P G1:81D1D 81D2P 81D2D TR FID"')
+        # main(r'-o xlsx "in/other/SEL-351S-6-R5 Standard Rev01 (2).rdb" --settings "RID TID SID G1:81D1P G1:81D1T 81D2P 81D2T TR FID"')
+        # main(r'-o xlsx "W:\Education\Current\Stationware Dump\20150511\SI" --settings "RID TID SID G1:81D1P G1:81D1D 81D2P 81D2D TR FID"')
+        # main(r'-o xlsx "W:\Education\Current\Stationware Dump\20150511\" --settings "RID TID G1:51P1P G1:51P1TD G1:51P1C TR FID"')
+        # W:\Education\Current\Stationware Dump
+        #main(r'-o xlsx "/media/mulhollandd/KINGSTON/stationware/rdb" --settings "RID TID FID"')
+        main(r'-o xlsx "/media/mulhollandd/KINGSTON/stationware/rdb" --settings "RID TID SID FID PARTNO BFID"')
+
+    else:
+        main()
@@ -7,9 +7,11 @@ This tool simply counts logic used and spare logic and the number of elements us
 """
 import re
 
+from collections import namedtuple
+from functools import lru_cache
 from named_constants import Constants
-from helpers import flatten, unique, remove_empty
-from intervals import get_interval_range, provide_string_range
+from helpers import flatten, unique, remove_empty, build_replacer
+from intervals import provide_string_range
 
 class RDBOperatorsConst(Constants):
     """
@@ -96,28 +98,135 @@ def getVariableRegex(variable_info):
     opWithRegexLessDollarsBit = re.sub(r'\$.*\$', '', opWithRegex)
     return opWithRegexLessDollarsBit
 
-def removeComment(eqn):
+def variable_parts(idents):
     """
-    Remove comments from an equation received as a string
+    Given a value from RDBOperatorsConst.TYPES, e.g. ['PLTxx$S$', 'PLTxx$R$', 'PLTxx']
+    return the name, the number of digits and any suffixes: ['PLT', 2, ['S', 'R']]
     """
-    return re.sub(RDBOperatorsConst.COMMENTS,'', eqn.strip())
+    name = idents[0].split('x')[0]
+    digits = len(re.findall('x+', idents[0])[0])
+    suffixes = flatten([re.findall(r'\$(.*)\$', i) for i in idents])
+    return [name, digits, suffixes]
 
-def eqnTokenise(eqn):
+def make_variable_regex(suffixes=False, capture=True):
     """
-    Tokenise an equation by splitting on whitespace
+    One regex matching a logic variable of any type, e.g. PSV01 or ASV001.
+    Each type is a named group so the type is available as match.lastgroup.
+
+    With suffixes, supplementary variables such as PCT01PU or PLT01S are matched
+    whole and the variable itself is the only capture group in each alternative.
     """
-    return eqn.split(" ")
+    alternatives = []
+    for key, value in RDBOperatorsConst.TYPES.items():
+        [name, digits, suffix_list] = variable_parts(value)
+        variable = name + '[0-9]{' + str(digits) + '}'
+        suffix = ''
+        if suffixes and suffix_list:
+            suffix_list.sort(key=len, reverse=True)
+            suffix = '(?:' + '|'.join(suffix_list) + ')?'
+
+        if not capture:
+            alternatives.append(variable + suffix)
+        elif suffixes:
+            alternatives.append('(' + variable + ')' + suffix)
+        else:
+            alternatives.append('(?P<' + key + '>' + variable + ')')
+    return re.compile('|'.join(alternatives))
 
-def getEquationElements(eqnArr, keepNumbers=False, removeEmpty=True, uniqueOnly=True, sorted=True):
+def element_functions():
     """
-    Remove cruft from equations:
-     * Remove operators
-     * Remove equation definition
-     * Remove logical operators
-     * Remove equality checks
-     * Optionally remove numbers
+    Functions which are removed from equations. As logical operators were
+    always removed first FLOOR( was never seen as a function, and still isn't
+    """
+    return [f for f in RDBOperatorsConst.FUNCTIONS_RAW
+            if not RDBOperatorsConst.LOGICAL_OPERATORS.search(f)]
+
+def make_lexer():
     """
+    A single regex which splits an equation into tokens in one left to right
+    pass, the kind of each token is the name of the group which matched:
+
+     COMMENT, SPACE, DEFINE (:=), LOGICAL (AND, NOT...), FUNCTION (e.g. ABS( ),
+     COMPARE (< > =), BRACKET, OPERATOR (+ * /), VARIABLE (logic variables),
+     NUMBER and WORD (relay word bits and anything else)
 
+    Like the regex substitutions this replaces, logical operators and
+    functions are found anywhere, even within words (so FOR is F and OR).
+    """
+    logical = RDBOperatorsConst.LOGICAL_OPERATORS.pattern
+    functions = '|'.join([f + r'\(' for f in element_functions()])
+    not_word = r' #<>=()+*/'
+    variable = make_variable_regex(suffixes=True, capture=False).pattern
+
+    return re.compile('|'.join([
+        r'(?P<COMMENT>#.*)',
+        r'(?P<SPACE> )',
+        r'(?P<DEFINE>(?<![^ ]):=(?![^ #]))',
+        r'(?P<LOGICAL>' + logical + ')',
+        r'(?P<FUNCTION>' + functions + ')',
+        r'(?P<COMPARE>[<>=])',
+        r'(?P<BRACKET>[()])',
+        r'(?P<OPERATOR>' + RDBOperatorsConst.OPERATORS.pattern + ')',
+        r'(?P<VARIABLE>(?:' + variable + r')(?![\w:]))',
+        r'(?P<NUMBER>-?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?![\w.:]))',
+        r'(?P<WORD>(?:(?!' + logical + '|' + functions + ')[^' + not_word + '])+)']))
+
+# compiled patterns for one variable type, see make_variable_patterns
+VariablePatterns = namedtuple('VariablePatterns',
+                              ['search', 'substitutions', 'replacer', 'count', 'names'])
+
+def make_variable_patterns():
+    """
+    Patterns for each variable type in RDBOperatorsConst.TYPES, compiled once:
+     search         finds any of the type's variables, longest first
+     substitutions  (regex, replacement) for each ident from getRawVariableFromTo,
+                    reducing e.g. PCT01PU to PCT01
+     replacer       carries out all the substitutions in one pass
+     count          matches the variable itself, from getVariableRegex
+     names          format strings for each ident, e.g. 'PLT{}S'
+    """
+    patterns = {}
+    for key, value in RDBOperatorsConst.TYPES.items():
+        search_regex = dict(getRawVariableFromTo(ident) for ident in value)
+        substrs = sorted(search_regex, key=len, reverse=True)
+        patterns[key] = VariablePatterns(
+            search=re.compile('|'.join(substrs)),
+            substitutions=tuple((re.compile(k), v) for k, v in search_regex.items()),
+            replacer=build_replacer(search_regex),
+            count=re.compile(getVariableRegex(value[0])),
+            names=tuple(re.sub('x+', '{}', ident).replace('$', '') for ident in value))
+    return patterns
+
+def make_joined_functions():
+    """
+    A regex for functions with logical operators, < or > inside them (e.g.
+    SANDIN( ) which became functions once those had been removed
+    """
+    removed = '(?:' + RDBOperatorsConst.LOGICAL_OPERATORS.pattern + '|[<>])*'
+    return re.compile('|'.join([removed.join(f) + removed + r'\(' for f in element_functions()]))
+
+LOGIC_VARIABLES = make_variable_regex()
+LOGIC_SUPPLEMENTARY = make_variable_regex(suffixes=True)
+SELOGIC_LEXER = make_lexer()
+JOINED_FUNCTIONS = make_joined_functions()
+VARIABLE_PATTERNS = make_variable_patterns()
+ELEMENT_FUNCTIONS = element_functions()
+ELEMENT_KINDS = ['WORD', 'VARIABLE', 'NUMBER']
+NO_OPERATORS = str.maketrans('', '', '+*/')
+
+def lex(eqn):
+    """
+    Tokenise an equation, yielding [kind, text] for each token, see make_lexer
+    """
+    for match in SELOGIC_LEXER.finditer(eqn):
+        yield [match.lastgroup, match.group()]
+
+def remove_not_elements(eqnArr, keepNumbers=False):
+    """
+    Remove operators, the equation definition, logical operators, comparisons,
+    functions, brackets and optionally numbers from each entry of eqnArr, one
+    regex substitution after another
+    """
     notElements = [RDBOperatorsConst.OPERATORS,
                    RDBOperatorsConst.EQUATION_DEF,
                    RDBOperatorsConst.LOGICAL_OPERATORS,
@@ -132,6 +241,101 @@ def getEquationElements(eqnArr, keepNumbers=False, removeEmpty=True, uniqueOnly=
     for removal in notElements:
         eqnArr = comp_sub(removal, eqnArr)
 
+    return eqnArr
+
+def cascade_elements(eqn, keepNumbers=False):
+    """
+    line_elements the slow way. Only used when the order of removal matters,
+    see make_joined_functions
+    """
+    return remove_not_elements(eqnTokenise(re.sub(RDBOperatorsConst.COMMENTS, '', eqn)),
+                               keepNumbers)
+
+def line_elements(eqn, keepNumbers=False):
+    """
+    Split an equation on spaces and return what is left of each part after
+    removing comments, operators, the equation definition, logical operators,
+    comparisons, functions, brackets and optionally numbers. There is one
+    entry per part, empty if nothing was left.
+    """
+    # operators are removed first so anything they split joins up again,
+    # exactly as when they were removed with the first regex substitution
+    eqn = eqn.translate(NO_OPERATORS)
+
+    for match in JOINED_FUNCTIONS.finditer(eqn):
+        if match.group()[:-1] not in ELEMENT_FUNCTIONS:
+            return cascade_elements(eqn, keepNumbers)
+
+    elements = []
+    element = ''
+    for match in SELOGIC_LEXER.finditer(eqn):
+        kind = match.lastgroup
+        if kind in ELEMENT_KINDS:
+            element += match.group()
+        elif kind == 'SPACE':
+            elements.append(element)
+            element = ''
+    elements.append(element)
+
+    if not keepNumbers:
+        elements = ['' if RDBOperatorsConst.NUMBERS.search(e) else e for e in elements]
+
+    return elements
+
+def reduce_variable(match):
+    return match.group(match.lastindex)
+
+def reduce_element(element):
+    """
+    Reduce supplementary variables in an element to the variable, e.g. PCT01PU to PCT01
+    """
+    reduced = LOGIC_SUPPLEMENTARY.sub(reduce_variable, element)
+    # only if removing a suffix left another one behind (e.g. PLT01SR) does the
+    # order matter, then substitute one variable type at a time as before
+    for match in LOGIC_SUPPLEMENTARY.finditer(reduced):
+        if match.end() - match.start() != len(match.group(match.lastindex)):
+            for patterns in VARIABLE_PATTERNS.values():
+                for variableRegex, variableNameAndNumOnly in patterns.substitutions:
+                    element = variableRegex.sub(variableNameAndNumOnly, element)
+            return element
+    return reduced
+
+def residual_element(element):
+    """
+    Remove all logic variables from an element
+    """
+    residual = LOGIC_VARIABLES.sub('', element)
+    # only if removing a variable joined up another (e.g. ASPSV01V001) does the
+    # order matter, then remove one variable type at a time as before
+    if residual and LOGIC_VARIABLES.search(residual):
+        for patterns in VARIABLE_PATTERNS.values():
+            element = patterns.count.sub('', element)
+        return element
+    return residual
+
+def removeComment(eqn):
+    """
+    Remove comments from an equation received as a string
+    """
+    return re.sub(RDBOperatorsConst.COMMENTS,'', eqn.strip())
+
+def eqnTokenise(eqn):
+    """
+    Tokenise an equation by splitting on whitespace
+    """
+    return eqn.split(" ")
+
+def getEquationElements(eqnArr, keepNumbers=False, removeEmpty=True, uniqueOnly=True, sorted=True):
+    """
+    Remove cruft from equations:
+     * Remove operators
+     * Remove equation definition
+     * Remove logical operators
+     * Remove equality checks
+     * Optionally remove numbers
+    """
+    eqnArr = remove_not_elements(eqnArr, keepNumbers)
+
     if removeEmpty:
         eqnArr = remove_empty(eqnArr)
 
@@ -149,16 +353,10 @@ def getSimpleLogicElements(arrEqnElements, uniqueOnly=True, sorted=True):
     return an array of them. Anything additional in the array should not be affected
     """
 
-    # substitute all element types
-    for key, value in RDBOperatorsConst.TYPES.items():
-        for ident in value:
-            # get regex
-            [variableRegex, variableNameAndNumOnly] = getRawVariableFromTo(ident)
-            # substitute
-            arrEqnElements = comp_sub(variableRegex, arrEqnElements, variableNameAndNumOnly)
+    # substitute all element types, e.g. PCT01PU becomes PCT01
+    arrEqnElements = [reduce_element(e) for e in arrEqnElements]
 
     if uniqueOnly:
-        #print(arrEqnElements)
         arrEqnElements = unique(arrEqnElements)
 
     if sorted:
@@ -170,13 +368,11 @@ def getEqnResidual(eqnArray, removeEmpty=True):
     """
     Given an array of RDB elements remove all known SELogic equation operators
     """
-    # substitute all element types
-    for key, value in RDBOperatorsConst.TYPES.items():
-        variableName = getVariableRegex(value[0])
-        eqnArray = comp_sub(variableName, eqnArray, '')
+    # remove all element types
+    eqnArray = [residual_element(e) for e in eqnArray]
 
-        if removeEmpty:
-            eqnArray = remove_empty(eqnArray)
+    if removeEmpty:
+        eqnArray = remove_empty(eqnArray)
 
     return eqnArray
 
@@ -186,21 +382,65 @@ def getEqnArrayOfArraysResidual(arr, removeEmpty=True):
     # Return the residual elements after removing operators and SELogic items
     return getEqnResidual(flatten(arr),removeEmpty)
 
+# lines held in the getLineComponents cache, each is a few small tuples
+LINE_CACHE_SIZE = 65536
+
+def normalise_line(eqn):
+    """
+    The line as getLineComponents sees it: stripped and without its comment,
+    so lines differing only in their comment share a cache entry. Whitespace
+    left before the comment is kept as it can change the result.
+    """
+    eqn = eqn.strip()
+    if '#' in eqn:
+        eqn = re.sub(RDBOperatorsConst.COMMENTS, '', eqn)
+    return eqn
+
 def getLineComponents(eqn, keepNumbers=False, uniqueOnly=True):
     """
     For a given line return three arrays:
     [line containing logic types and RWBs] [only logic] [only RWBs]
+
+    Results are cached by normalised line text for every caller in the
+    process, see line_cache_info
+    """
+    return [list(c) for c in line_components(normalise_line(eqn), keepNumbers, uniqueOnly)]
+
+@lru_cache(maxsize=LINE_CACHE_SIZE)
+def line_components(eqn, keepNumbers, uniqueOnly):
+    """
+    getLineComponents for a normalised line, as tuples as they are shared
     """
-    raw_line = eqnTokenise(removeComment(eqn))
-    # remove operators, brackets etc. TODO: Is ABS(x) more expensive than x? I don't take this into account
-    raw_line = getEquationElements(raw_line, keepNumbers, uniqueOnly=uniqueOnly)
+    # remove comments, operators, brackets etc. TODO: Is ABS(x) more expensive than x? I don't take this into account
+    raw_line = remove_empty(line_elements(eqn, keepNumbers))
+    if uniqueOnly:
+        raw_line = unique(raw_line)
+    raw_line.sort()
+
     eqn_elements = getSimpleLogicElements(raw_line, uniqueOnly=uniqueOnly)
 
     residual_elements = getEqnResidual(eqn_elements)
 
-    logic_elements = [x for x in eqn_elements if x not in residual_elements]
+    residual_set = set(residual_elements)
+    logic_elements = [x for x in eqn_elements if x not in residual_set]
 
-    return [eqn_elements, logic_elements, residual_elements]
+    return (tuple(eqn_elements), tuple(logic_elements), tuple(residual_elements))
+
+def line_cache_info():
+    """
+    How well the getLineComponents cache is being reused, e.g.
+    {'hits': 9000, 'misses': 1000, 'size': 1000, 'maxsize': 65536, 'hit_rate': 0.9}
+    """
+    info = line_components.cache_info()
+    lookups = info.hits + info.misses
+    return {'hits': info.hits,
+            'misses': info.misses,
+            'size': info.currsize,
+            'maxsize': info.maxsize,
+            'hit_rate': info.hits / lookups if lookups else 0.0}
+
+def clear_line_cache():
+    line_components.cache_clear()
 
 def countElementsUsed(eqn):
     """ 
@@ -212,45 +452,77 @@ def countElementsUsed(eqn):
     return len(elements[0]) + len(functions)
 
 def get_logic_usage(ltext):
+    return UsageSummary(ltext).usage()
 
-    results = {}
-
-    logic_lines = ltext.strip().split("\n")
-    results['LINES'] = len(logic_lines)
-
-    # lines without comments
-    lines_less_comments = [removeComment(l) for l in logic_lines]
-
-    # lines without blank or comment lines
-    lines_nb_nc = remove_empty(lines_less_comments)
-    results['LINES_UNCOMMENTED'] = len(lines_nb_nc)
-
-    tokenised_lines = [[l.split(" ")] for l in lines_less_comments]
-
-    raw_line_elements = []
-    logic_elements = []
-    residual_elements = []
-
-    for line in logic_lines:
-        [int_eqn_elements, int_logic_elements, int_residual_elements] = getLineComponents(line,keepNumbers=False)
-
-        raw_line_elements.append(int_eqn_elements)
-        logic_elements.append(int_logic_elements)
-        residual_elements.append(int_residual_elements)
-
-    # We are only interested in totals, so flatten the array and take only unique values
-    logic_elements = unique(flatten(logic_elements))
-    residual_elements = unique(flatten(residual_elements))
-
-    logic_elements.sort()
-    residual_elements.sort()
-
-    for key, value in RDBOperatorsConst.TYPES.items():
-        search_string = getVariableRegex(value[0])
-        count = comp_count(logic_elements, search_string)
-        results[key] = str(count)
+class UsageSummary:
+    """
+    What get_logic_usage needs to know about some logic: line counts and the
+    logic and residual elements used. Summaries merge, so the usage of blocks
+    joined together comes from their summaries without going through the text
+    again:
+
+        protection = UsageSummary(l1)
+        automation = UsageSummary(a1 + '\n' + a2)
+        protection.merge(automation).usage() == get_logic_usage(l1 + '\n' + a1 + '\n' + a2)
+    """
 
-    return [results, logic_elements, residual_elements]
+    def __init__(self, text=''):
+        lines = text.split('\n')
+        blank = [not l.strip() for l in lines]
+
+        # text is stripped before counting lines, so blank lines only count
+        # when they aren't at either end
+        self.lines = len(lines)
+        self.leading = blank.index(False) if False in blank else len(lines)
+        self.trailing = blank[::-1].index(False) if False in blank else len(lines)
+
+        # lines without blank or comment lines
+        self.uncommented = len([l for l in lines if l.strip() and not l.strip().startswith('#')])
+
+        self.logic_elements = set()
+        self.residual_elements = set()
+        for line in lines:
+            [eqn_elements, logic_elements, residual_elements] = \
+                line_components(normalise_line(line), False, True)
+            self.logic_elements.update(logic_elements)
+            self.residual_elements.update(residual_elements)
+
+    def is_blank(self):
+        return self.leading == self.lines
+
+    def merge(self, other):
+        """ the summary of this text and other's joined by a newline """
+        merged = UsageSummary()
+        merged.lines = self.lines + other.lines
+        merged.leading = self.lines + other.leading if self.is_blank() else self.leading
+        merged.trailing = other.lines + self.trailing if other.is_blank() else other.trailing
+        merged.uncommented = self.uncommented + other.uncommented
+        merged.logic_elements = self.logic_elements | other.logic_elements
+        merged.residual_elements = self.residual_elements | other.residual_elements
+        return merged
+
+    def line_count(self):
+        if self.is_blank():
+            return 1
+        return self.lines - self.leading - self.trailing
+
+    def usage(self):
+        """ [counts, logic elements, residual elements] as get_logic_usage returns """
+        results = {}
+        results['LINES'] = self.line_count()
+        results['LINES_UNCOMMENTED'] = self.uncommented
+
+        logic_elements = sorted(self.logic_elements)
+        residual_elements = sorted(self.residual_elements)
+
+        counts = dict.fromkeys(RDBOperatorsConst.TYPES, 0)
+        for match in LOGIC_VARIABLES.finditer(' '.join(logic_elements)):
+            counts[match.lastgroup] += 1
+
+        for key, count in counts.items():
+            results[key] = str(count)
+
+        return [results, logic_elements, residual_elements]
 
 def make_limits(name, min=False, max=False):
     """
@@ -273,26 +545,109 @@ def make_limits(name, min=False, max=False):
         max_chars = str(len(str(lims[1])))
         return [name + ('{:0>' + max_chars + '}').format(str(r)) for r in rng]
 
-def find_unused_logic(type, used, provideRaw=False, lowestAllowed=None, highestAllowed=None):
+def bit_numbers(bits):
+    """ the numbers of the set bits, lowest first """
+    numbers = []
+    while bits:
+        lowest = bits & -bits
+        numbers.append(lowest.bit_length() - 1)
+        bits ^= lowest
+    return numbers
+
+def bit_ranges(bits):
+    """ (first, last) for each run of set bits, as get_interval_range returns """
+    ranges = []
+    while bits:
+        first = (bits & -bits).bit_length() - 1
+        run = bits >> first
+        # run + 1 carries through the run of ones to the bit after it
+        length = (~run & (run + 1)).bit_length() - 1
+        ranges.append((first, first + length - 1))
+        bits &= ~(((1 << length) - 1) << first)
+    return ranges
+
+def limit_mask(type, lowest=None, highest=None):
+    """ bits set for every variable number of type, optionally within lowest to highest """
+    [minimum, maximum] = RDBOperatorsConst.LIMITS[type]
+    lowest = minimum if lowest == None else max(lowest, minimum)
+    highest = maximum if highest == None else min(highest, maximum)
+    if lowest > highest:
+        return 0
+    return ((1 << (highest - lowest + 1)) - 1) << lowest
+
+class VariableUsage:
+    """
+    Which logic variables are used, as an integer bitset for each type with
+    bit n set when variable n is used, e.g. bit 3 of bits['PSV'] for PSV03.
+    Counts, free ranges and the next free variables are then bit operations.
+    """
+
+    def __init__(self, used=()):
+        self.bits = dict.fromkeys(RDBOperatorsConst.TYPES, 0)
+        self.add(used)
+
+    def add(self, names):
+        for name in names:
+            match = LOGIC_VARIABLES.fullmatch(name)
+            if match:
+                self.bits[match.lastgroup] |= 1 << int(name[len(match.lastgroup):])
+
+    def remove(self, names):
+        for name in names:
+            match = LOGIC_VARIABLES.fullmatch(name)
+            if match:
+                self.bits[match.lastgroup] &= ~(1 << int(name[len(match.lastgroup):]))
+
+    def name(self, type, number):
+        digits = len(str(RDBOperatorsConst.LIMITS[type][1]))
+        return type + str(number).zfill(digits)
+
+    def used_bits(self, type):
+        return self.bits[type] & limit_mask(type)
+
+    def free_bits(self, type, lowest=None, highest=None):
+        return limit_mask(type, lowest, highest) & ~self.bits[type]
+
+    def used_count(self, type):
+        return bin(self.used_bits(type)).count('1')
+
+    def free_count(self, type, lowest=None, highest=None):
+        return bin(self.free_bits(type, lowest, highest)).count('1')
+
+    def used(self, type):
+        return [self.name(type, n) for n in bit_numbers(self.used_bits(type))]
+
+    def free(self, type, lowest=None, highest=None):
+        return [self.name(type, n) for n in bit_numbers(self.free_bits(type, lowest, highest))]
+
+    def free_ranges(self, type, lowest=None, highest=None):
+        return bit_ranges(self.free_bits(type, lowest, highest))
+
+    def next_free(self, type, qty=1, lowest=None, highest=None):
+        """ the first qty free variables of type, lowest numbered first """
+        bits = self.free_bits(type, lowest, highest)
+        names = []
+        while bits and len(names) < qty:
+            first = bits & -bits
+            names.append(self.name(type, first.bit_length() - 1))
+            bits ^= first
+        return names
+
+def find_unused_logic(type, used, provideRaw=False, lowestAllowed=None, highestAllowed=None, usage=None):
+    """
+    The variables of type not in used, as a string of ranges (e.g. '1-5, 9')
+    or with provideRaw a list of names between lowestAllowed and highestAllowed.
+    A VariableUsage for used can be given as usage to save building one.
+    """
     # TODO: FIXME: lowestAllowed only works with provideRaw
-    full_list = make_limits(type)
-    if full_list != None:
-        unused = [l for l in full_list if l not in used]
-        regex_only_numbers = re.compile(r'^' + type)
-        only_numbers = [int(re.sub(regex_only_numbers,'',val)) for val in unused]
-        rng = get_interval_range(only_numbers)
+    if type in RDBOperatorsConst.LIMITS:
+        if usage == None:
+            usage = VariableUsage(used)
 
         if provideRaw == False:
-            return provide_string_range(rng)
+            return provide_string_range(usage.free_ranges(type))
         else:
-            if lowestAllowed and not highestAllowed:
-                return [u for u in unused if int(re.findall(r'[A-Z]+([0-9]+)[A-Z]*', u)[0]) >= lowestAllowed]
-            elif not lowestAllowed and highestAllowed:
-                return [u for u in unused if int(re.findall(r'[A-Z]+([0-9]+)[A-Z]*', u)[0]) <= highestAllowed]
-            elif lowestAllowed and highestAllowed:
-                return [u for u in unused if lowestAllowed <= int(re.findall(r'[A-Z]+([0-9]+)[A-Z]*', u)[0]) <= highestAllowed]
-            else:
-                return unused
+            return usage.free(type, lowestAllowed or None, highestAllowed or None)
     else:
         return ''
 
@@ -311,14 +666,15 @@ def calc_logic_usage(logic_text):
 
     del usage_info['LINES']
     del usage_info['LINES_UNCOMMENTED']
- 
+
+    usage = VariableUsage(logic_used)
     for operator_type, used_qty in usage_info.items():
         total = RDBOperatorsConst.LIMITS[operator_type][1]
         returnval += ' '.join([operator_type,
               'Used:', '{:>3}'.format(used_qty),
               '/' ' {:<4}'.format(RDBOperatorsConst.LIMITS[operator_type][1]), 
               'Unused: {:<4.0%}   Available: '.format(1-int(used_qty)/total) + 
-              find_unused_logic(operator_type, logic_used), '\n'])
+              find_unused_logic(operator_type, logic_used, usage=usage), '\n'])
     
     return returnval
 
@@ -327,11 +683,14 @@ def calc_usage_raw(logic_texts):
     Calculate the logic usage.
     Just I think a calculation of the number of "residual elements"
     Where Numbers also count
+    logic_texts can also be a UsageSummary, e.g. of several blocks merged
     """
 
     usage_sum = {}
 
-    r = get_logic_usage(logic_texts)
+    if not isinstance(logic_texts, UsageSummary):
+        logic_texts = UsageSummary(logic_texts)
+    r = logic_texts.usage()
     [usage_info, logic_used, residue] = r
 
     usage_sum['Lines Used (w/ comment lines)'] = usage_info['LINES']
@@ -339,14 +698,16 @@ def calc_usage_raw(logic_texts):
 
     del usage_info['LINES']
     del usage_info['LINES_UNCOMMENTED']
- 
+
+    usage = VariableUsage(logic_used)
     for operator_type, used_qty in usage_info.items():
         total = RDBOperatorsConst.LIMITS[operator_type][1]
         usage_sum[operator_type] = {}
         usage_sum[operator_type]['qty'] = used_qty
         usage_sum[operator_type]['total'] = RDBOperatorsConst.LIMITS[operator_type][1]
         usage_sum[operator_type]['free_pu'] = (1-int(used_qty)/total)
-        usage_sum[operator_type]['available_detail'] = find_unused_logic(operator_type, logic_used)
+        usage_sum[operator_type]['available_detail'] = find_unused_logic(operator_type, logic_used,
+                                                                         usage=usage)
 
     return usage_sum
 
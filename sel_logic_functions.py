@@ -12,8 +12,8 @@ def getInstVals(name):
     type = name[0:3] # SEL variables all have a type 3 chars long
     num = name[3:]   #     and a value which is the remainder
 
-    type_inst = sel_logic_count.RDBOperatorsConst.TYPES[type]
-    types = [re.sub(r'x+', num, e).replace('$', '') for e in type_inst]
+    names = sel_logic_count.VARIABLE_PATTERNS[type].names
+    types = [n.format(num) for n in names]
     return types
 
 def change_type_vals(e, to):
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+"""
+sel_logic_graph.py
+Which variables feed which in an SELogic program, as a directed graph from
+each name used in an equation to the variable it defines:
+
+    PCT16IN := PLT21 AND R_TRIG PSV36     PLT21 -> PCT16IN, PSV36 -> PCT16IN
+
+The settings of a timer, latch or counter also feed its outputs, so PCT16IN,
+PCT16PU and PCT16DO feed PCT16Q and PLT01S and PLT01R feed PLT01, when they
+are defined.
+
+Lines are added and removed as the program changes so every query is a
+lookup in the adjacency maps rather than a scan of the text:
+
+    graph = DependencyGraph()
+    graph.add('PSV01', ['IN101', 'PSV02'])
+    graph.fan_in('PSV01')     # ['IN101', 'PSV02']
+    graph.cone('IN101')       # ['PSV01', ...] everything IN101 affects
+    graph.unused()            # defined but not used by any other logic
+"""
+
+import re
+
+from collections import Counter
+
+from sel_logic_parse import tokenise, LOGICAL
+import sel_logic_count
+
+# outputs of each variable type with settings, the other suffixes are inputs
+OUTPUTS = {'PLT': [''], 'PCT': ['Q'], 'PST': ['ET', 'Q'], 'PCN': ['CV', 'Q'],
+           'ALT': [''], 'AST': ['ET', 'Q'], 'ACN': ['CV', 'Q']}
+
+ELEMENT_NAME = re.compile(r'([A-Z]{3})([0-9]+)([A-Z]*)')
+
+def make_elements():
+    """ for each type in OUTPUTS, [input suffixes, output suffixes] """
+    elements = {}
+    for key, outputs in OUTPUTS.items():
+        names = sel_logic_count.VARIABLE_PATTERNS[key].names
+        suffixes = [n.split('}')[1] for n in names]
+        elements[key] = [[s for s in suffixes if s not in outputs], outputs]
+    return elements
+
+ELEMENTS = make_elements()
+
+def element_parts(name):
+    """ [inputs, outputs] of the element name belongs to, e.g. PCT16IN gives
+    [['PCT16IN', 'PCT16PU', 'PCT16DO'], ['PCT16Q']], None if it has no settings """
+    match = ELEMENT_NAME.fullmatch(name)
+    if match == None or match.group(1) not in ELEMENTS:
+        return None
+    [type, num, suffix] = match.groups()
+    [inputs, outputs] = ELEMENTS[type]
+    if suffix not in inputs and suffix not in outputs:
+        return None
+    return [[type + num + s for s in inputs], [type + num + s for s in outputs]]
+
+def line_operands(parsed):
+    """ names used by a parsed line, from the tokens if it didn't parse """
+    if parsed.expr != None:
+        return parsed.operands()
+    if parsed.value == None:
+        return []
+    names = [value for kind, value in tokenise(parsed.value)
+             if kind == 'NAME' and value not in LOGICAL
+             and value not in sel_logic_count.RDBOperatorsConst.FUNCTIONS_RAW]
+    return list(dict.fromkeys(names))
+
+class DependencyGraph:
+    """ definitions -> uses, counted so the same edge can come from several lines """
+
+    def __init__(self):
+        self.users = {}       # name -> Counter of variables defined using it
+        self.sources = {}     # variable -> Counter of names its definitions use
+        self.defined = Counter()
+
+    def add(self, target, operands):
+        """ add a line defining target from operands """
+        if target == None:
+            return
+        self.defined[target] += 1
+        for name in operands:
+            self.users.setdefault(name, Counter())[target] += 1
+            self.sources.setdefault(target, Counter())[name] += 1
+
+    def remove(self, target, operands):
+        if target == None:
+            return
+        self.defined[target] -= 1
+        if self.defined[target] == 0:
+            del self.defined[target]
+        for name in operands:
+            for edges, key, other in [(self.users, name, target), (self.sources, target, name)]:
+                edges[key][other] -= 1
+                if edges[key][other] == 0:
+                    del edges[key][other]
+                    if not edges[key]:
+                        del edges[key]
+
+    def fan_in(self, name):
+        """ names name is directly defined from, including settings of its element """
+        result = list(self.sources.get(name, []))
+        parts = element_parts(name)
+        if parts and name in parts[1]:
+            result += [n for n in parts[0] if n in self.defined and n not in result]
+        return result
+
+    def fan_out(self, name):
+        """ variables directly defined using name, including outputs of its element """
+        result = list(self.users.get(name, []))
+        parts = element_parts(name)
+        if parts and name in parts[0] and name in self.defined:
+            result += [n for n in parts[1] if n not in result]
+        return result
+
+    def cone(self, name, upstream=False):
+        """
+        Every name name affects, or with upstream every name which affects it,
+        nearest first
+        """
+        step = self.fan_in if upstream else self.fan_out
+        seen = {name}
+        result = []
+        queue = [name]
+        for current in queue:
+            for n in step(current):
+                if n not in seen:
+                    seen.add(n)
+                    result.append(n)
+                    queue.append(n)
+        return result
+
+    def is_used(self, name):
+        """ whether other logic uses name, or for a setting the element's outputs """
+        if name in self.users:
+            return True
+        parts = element_parts(name)
+        if parts and name in parts[0]:
+            return any(o in self.users for o in parts[1])
+        return False
+
+    def unused(self):
+        """ variables defined but not used by any logic, sorted """
+        return sorted(n for n in self.defined if not self.is_used(n))
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+
+"""
+sel_logic_parse.py
+Parses SELogic lines into a small syntax tree so that counting, analysis and
+rewrites can share one parse of each line rather than splitting the text again.
+
+A line is an optional definition, an equation and an optional comment:
+
+    PCT21IN := PLT15 AND (PCT05Q AND NOT 52CLS) # CB CLOSE FAILURE
+
+Precedence follows the SEL-400 series instruction manual, highest first:
+parentheses and functions, then NOT, R_TRIG, F_TRIG and negation, then * and
+/, + and -, the comparisons, AND and finally OR. At most 14 nested sets of
+parentheses are allowed in an equation.
+
+Parsing is memoised by line text, so the ParsedLine returned is shared and
+must not be changed. Lines which don't parse are returned with errors set
+rather than raising:
+
+    line = parse_line('PSV01 := IN101 AND R_TRIG PSV02 # X')
+    line.target        # 'PSV01'
+    line.operands()    # ['IN101', 'PSV02']
+    line.edges()       # [['R_TRIG', 'PSV02']]
+    line.errors        # []
+"""
+
+import re
+
+from functools import lru_cache
+
+import sel_logic_count
+
+MAX_PAREN_DEPTH = 14
+PARSE_CACHE_SIZE = 16384
+
+LOGICAL = ['AND', 'OR', 'NOT', 'R_TRIG', 'F_TRIG']
+UNARY = ['NOT', 'R_TRIG', 'F_TRIG', '-']
+EDGES = ['R_TRIG', 'F_TRIG']
+
+# binary operators from lowest to highest precedence
+BINARY_LEVELS = [['OR'],
+                 ['AND'],
+                 ['<=', '>=', '<>', '<', '>', '='],
+                 ['+', '-'],
+                 ['*', '/']]
+
+TOKENS = re.compile(r"""
+     (?P<SPACE>\s+)
+    |(?P<COMMENT>\#.*)
+    |(?P<DEFINE>:=)
+    |(?P<OPERATOR><=|>=|<>|[<>=+\-*/])
+    |(?P<BRACKET>[()])
+    |(?P<NUMBER>(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?![\w.]))
+    |(?P<NAME>[\w.:]+)
+    |(?P<ERROR>.)
+    """, re.VERBOSE)
+
+class ParseError(Exception):
+    pass
+
+class Node:
+    """
+    A node of an equation. kind is one of:
+     name    an RWB, logic variable or alias, value is the name
+     number  value is the number as written
+     group   parentheses around children[0]
+     call    a function, value is the function name, children[0] the argument
+     unary   value is NOT, R_TRIG, F_TRIG or -
+     binary  value is the operator, AND, OR, <, +, etc.
+    """
+    __slots__ = ['kind', 'value', 'children']
+
+    def __init__(self, kind, value=None, children=()):
+        self.kind = kind
+        self.value = value
+        self.children = list(children)
+
+    def walk(self):
+        """ this node and all nodes below it, depth first """
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def __eq__(self, other):
+        return (isinstance(other, Node) and self.kind == other.kind and
+                self.value == other.value and self.children == other.children)
+
+    def __repr__(self):
+        if self.children:
+            return 'Node({!r}, {!r}, {!r})'.format(self.kind, self.value, self.children)
+        return 'Node({!r}, {!r})'.format(self.kind, self.value)
+
+    def __str__(self):
+        """ the equation as SELogic text """
+        if self.kind in ['name', 'number']:
+            return self.value
+        elif self.kind == 'group':
+            return '(' + str(self.children[0]) + ')'
+        elif self.kind == 'call':
+            return self.value + '(' + str(self.children[0]) + ')'
+        elif self.kind == 'unary':
+            separator = '' if self.value == '-' else ' '
+            return self.value + separator + str(self.children[0])
+        else:
+            return ' '.join([str(self.children[0]), self.value, str(self.children[1])])
+
+class Parser:
+    """ recursive descent over the tokens of one equation """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return [None, None]
+
+    def take(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise ParseError('Missing equation')
+        node = self.binary(0)
+        if self.pos < len(self.tokens):
+            raise ParseError('Unexpected {}'.format(self.peek()[1]))
+        return node
+
+    def binary(self, level):
+        if level == len(BINARY_LEVELS):
+            return self.unary()
+        node = self.binary(level + 1)
+        while self.peek()[1] in BINARY_LEVELS[level] and self.peek()[0] in ['OPERATOR', 'NAME']:
+            operator = self.take()[1]
+            node = Node('binary', operator, [node, self.binary(level + 1)])
+        return node
+
+    def unary(self):
+        [kind, value] = self.peek()
+        if value in UNARY and kind in ['OPERATOR', 'NAME']:
+            self.take()
+            return Node('unary', value, [self.unary()])
+        return self.primary()
+
+    def primary(self):
+        [kind, value] = self.take()
+        if kind == None:
+            raise ParseError('Unexpected end of equation')
+        elif kind == 'NUMBER':
+            return Node('number', value)
+        elif kind == 'BRACKET' and value == '(':
+            node = Node('group', None, [self.binary(0)])
+            self.close()
+            return node
+        elif kind == 'NAME' and value not in LOGICAL:
+            if value in sel_logic_count.RDBOperatorsConst.FUNCTIONS_RAW and self.peek()[1] == '(':
+                self.take()
+                node = Node('call', value, [self.binary(0)])
+                self.close()
+                return node
+            return Node('name', value)
+        raise ParseError('Unexpected {}'.format(value))
+
+    def close(self):
+        if self.take()[1] != ')':
+            raise ParseError('Missing )')
+
+def tokenise(code):
+    """ [kind, text] for each token in code, whitespace and comments dropped """
+    tokens = []
+    for match in TOKENS.finditer(code):
+        kind = match.lastgroup
+        if kind not in ['SPACE', 'COMMENT']:
+            tokens.append([kind, match.group()])
+    return tokens
+
+def paren_depth(tokens):
+    """ deepest nesting of parentheses, None if they don't pair up """
+    depth = 0
+    deepest = 0
+    for kind, value in tokens:
+        if kind == 'BRACKET':
+            depth += 1 if value == '(' else -1
+            if depth < 0:
+                return None
+            deepest = max(deepest, depth)
+    return deepest if depth == 0 else None
+
+class ParsedLine:
+    """
+    A parsed line of SELogic. code is the line without its comment, target the
+    variable defined (None for comment or blank lines), value the text of the
+    equation and expr its syntax tree. Anything wrong is listed in errors.
+    """
+    __slots__ = ['text', 'code', 'comment', 'target', 'value', 'expr', 'depth', 'errors',
+                 '_elements_used']
+
+    def __init__(self, text):
+        self.text = text
+        self.code = sel_logic_count.removeComment(text).strip()
+        self.comment = text[text.index('#'):].strip() if '#' in text else ''
+        self.target = None
+        self.value = None
+        self.expr = None
+        self.depth = 0
+        self.errors = []
+        self._elements_used = None
+
+        if self.code:
+            self.parse()
+
+    def parse(self):
+        [left, define, right] = self.code.partition(':=')
+        if not define:
+            self.errors.append('Missing :=')
+            return
+
+        self.target = left.strip()
+        self.value = right.strip()
+        if not re.match(r'^[\w.]+$', self.target):
+            self.errors.append('Invalid target {}'.format(self.target))
+
+        tokens = tokenise(self.value)
+        errors = [value for kind, value in tokens if kind == 'ERROR']
+        if errors:
+            self.errors.append('Unexpected characters {}'.format(''.join(errors)))
+            return
+
+        depth = paren_depth(tokens)
+        if depth == None:
+            self.errors.append('Unbalanced parentheses')
+            return
+        self.depth = depth
+        if depth > MAX_PAREN_DEPTH:
+            self.errors.append('{} nested parentheses, at most {} are allowed'.format(
+                depth, MAX_PAREN_DEPTH))
+
+        try:
+            self.expr = Parser(tokens).parse()
+        except ParseError as e:
+            self.errors.append(str(e))
+
+    def is_comment(self):
+        return not self.code
+
+    def is_valid(self):
+        return not self.errors
+
+    def nodes(self, kind=None):
+        if self.expr == None:
+            return []
+        return [n for n in self.expr.walk() if kind == None or n.kind == kind]
+
+    def operands(self, numbers=False):
+        """ unique names used in the equation, in order, optionally with numbers """
+        kinds = ['name', 'number'] if numbers else ['name']
+        return list(dict.fromkeys(n.value for n in self.nodes() if n.kind in kinds))
+
+    def operators(self):
+        """ every operator used, in order, e.g. ['AND', 'NOT', 'OR'] """
+        return [n.value for n in self.nodes() if n.kind in ['unary', 'binary']]
+
+    def functions(self):
+        return [n.value for n in self.nodes('call')]
+
+    def edges(self):
+        """ [R_TRIG or F_TRIG, the text it applies to] for each edge trigger """
+        return [[n.value, str(n.children[0])] for n in self.nodes('unary') if n.value in EDGES]
+
+    def elements_used(self):
+        """ logic elements used by the line, as counted by sel_logic_count """
+        if self._elements_used == None:
+            self._elements_used = sel_logic_count.countElementsUsed(self.text)
+        return self._elements_used
+
+    def __repr__(self):
+        return 'ParsedLine({!r})'.format(self.text)
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_line(text):
+    """ parse one line of SELogic, results are cached by the text of the line """
+    return ParsedLine(text)
+
+def parse_lines(text):
+    return [parse_line(l) for l in text.split('\n')]
+
+def check_logic(text):
+    """ [line number, line, error] for each problem found in text, line numbers start at 1 """
+    problems = []
+    for num, line in enumerate(parse_lines(text), 1):
+        for error in line.errors:
+            problems.append([num, line.text, error])
+    return problems
+
+if __name__ == '__main__':
+    for problem in check_logic(sel_logic_count.logic_text + sel_logic_count.logic_text_2):
+        print('{:>4}: {}\n      {}'.format(*problem))